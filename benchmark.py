@@ -0,0 +1,321 @@
+"""Timing benchmarks for the simulation tick, level generation and rendering.
+
+Every phase runs over a grid of level, NPC, obstacle and bullet counts and
+reports median and 99th percentile times in milliseconds as JSON:
+
+    python benchmark.py -o baseline.json
+    python benchmark.py --baseline baseline.json
+
+With --baseline the run is compared against a saved result, and the exit
+status is 1 if any median regressed by more than --threshold.
+
+The render phases draw full frames of a frontend into an offscreen
+framebuffer on a hidden GLUT window. They need an X display; on a
+headless machine run under xvfb-run, where Mesa's software rasterizer
+gives comparable numbers between hosts. Without a display they are
+skipped.
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import levels
+from occlusion import SightMap
+from rollback import SavedStates
+from simulation import (GameState, Level, Simulation, update_bullets, update_npcs,
+                        update_player_movement, update_spotter)
+from timestep import FixedStepLoop
+
+TICK_PHASES = (
+    ('update_spotter', lambda game, now: update_spotter(game, now)),
+    ('update_player_movement', lambda game, now: update_player_movement(game, now)),
+    ('update_bullets', lambda game, now: update_bullets(game)),
+    ('update_npcs', lambda game, now: update_npcs(game, now))
+)
+
+FRONTENDS = {'grlightx': 'GRLightX.py', 'mugunghwa': 'Mugunghwa .py'}
+
+def make_game(level, npcs, obstacles, bullets, seed=0, rules=None):
+    """A game at the given level with exactly this many NPCs, obstacles and bullets.
+
+    rules are tuning constants to play by, such as a frontend's overrides.
+    """
+    game = GameState(seed=seed)
+    vars(game).update(rules or {})
+    game.NPC_COUNT = npcs
+    # reset_level adds obstacles per level on top of the base count
+    game.BASE_OBSTACLE_COUNT = obstacles - (level - 1) * game.OBSTACLES_PER_LEVEL
+    game.current_level = level
+    game.reset_level()
+    game.show_level_start = False
+    # Circle on the spot so the player keeps moving without reaching the finish
+    game.keys_pressed[b'w'] = game.keys_pressed[b'a'] = True
+    game.target_bullets = bullets
+    refresh(game)
+    return game
+
+def refresh(game):
+    """Undo the effects of the last tick that would shrink the workload."""
+    game.game_over = game.player_caught = False
+    npcs = game.npcs
+    npcs.pos[npcs.finished, 0] = 0
+    npcs.caught[:] = False
+    npcs.finished[:] = False
+    missing = game.target_bullets - len(game.bullets)
+    if missing > 0:
+        # Far enough out that they take a while to home in on the player
+        angle = game.np_rng.uniform(0, 2 * np.pi, missing)
+        distance = game.np_rng.uniform(1000, 1900, missing)
+        for a, d in zip(angle, distance):
+            game.bullets.spawn(game.player_pos[0] + np.cos(a) * d, game.player_pos[1] + np.sin(a) * d, 0)
+
+def summarize(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        'median_ms': float(np.median(ms)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'samples': len(ms)
+    }
+
+def bench_tick(params, samples, warmup):
+    game = make_game(**params)
+    times = {name: [] for name, _ in TICK_PHASES}
+    times['tick'] = []
+    sight = []
+    saves, restores = [], []
+    sim = Simulation(game)
+    states = SavedStates(sim, 1)
+    dt = 1.0 / game.TICK_RATE
+    timer = time.perf_counter
+    for i in range(warmup + samples):
+        refresh(game)
+        now = game.clock.now()
+        total = 0.0
+        for name, phase in TICK_PHASES:
+            start = timer()
+            phase(game, now)
+            elapsed = timer() - start
+            total += elapsed
+            if i >= warmup:
+                times[name].append(elapsed)
+        if i >= warmup:
+            times['tick'].append(total)
+        # Line of sight for every actor at once, the worst case of a red light
+        xs = np.append(game.npcs.pos[:, 0], game.player_pos[0])
+        ys = np.append(game.npcs.pos[:, 1], game.player_pos[1])
+        start = timer()
+        game.sight.visible(xs, ys)
+        if i >= warmup:
+            sight.append(timer() - start)
+        # What a rollback pays per tick it re-simulates, and once to rewind
+        start = timer()
+        states.save(sim, 0)
+        elapsed = timer() - start
+        start = timer()
+        states.restore(sim, 0)
+        if i >= warmup:
+            saves.append(elapsed)
+            restores.append(timer() - start)
+        game.clock.advance(dt)
+    results = {f'tick.{name}': summarize(values) for name, values in times.items()}
+    results['los.all_actors'] = summarize(sight)
+    results['state.save'] = summarize(saves)
+    results['state.restore'] = summarize(restores)
+    return results
+
+def bench_level(params, samples, warmup):
+    game = make_game(**params)
+    times = []
+    sight = []
+    loads = []
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        path = os.path.join(directory, 'level.lvl')
+        levels.save(Level(game, game.current_level, game.run), path)
+        for i in range(warmup + samples):
+            start = time.perf_counter()
+            game.reset_level()
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            SightMap.for_game(game)
+            sight_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            game.reset_level(levels.load(path))
+            if i >= warmup:
+                times.append(elapsed)
+                sight.append(sight_elapsed)
+                loads.append(time.perf_counter() - start)
+    return {'level.reset_level': summarize(times), 'level.sight_map': summarize(sight),
+            'level.load': summarize(loads)}
+
+def load_frontend(name):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), FRONTENDS[name])
+    spec = importlib.util.spec_from_file_location(f'frontend_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def open_gl_context(width, height):
+    """A hidden GLUT window rendering into an offscreen framebuffer; returns the GL renderer."""
+    os.environ.setdefault('LIBGL_ALWAYS_SOFTWARE', '1')
+    from OpenGL.GL import (GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_DEPTH_COMPONENT24,
+                           GL_DEPTH_TEST, GL_FRAMEBUFFER, GL_RENDERBUFFER, GL_RENDERER, GL_RGBA8,
+                           glBindFramebuffer, glBindRenderbuffer, glEnable, glFramebufferRenderbuffer,
+                           glGenFramebuffers, glGenRenderbuffers, glGetString, glRenderbufferStorage,
+                           glViewport)
+    from OpenGL.GLUT import (GLUT_DEPTH, GLUT_DOUBLE, GLUT_RGBA, glutCreateWindow, glutHideWindow,
+                             glutInit, glutInitDisplayMode, glutInitWindowSize)
+    glutInit()
+    glutInitDisplayMode(GLUT_RGBA | GLUT_DOUBLE | GLUT_DEPTH)
+    glutInitWindowSize(width, height)
+    glutCreateWindow(b"benchmark")
+    glutHideWindow()
+    framebuffer = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+    for storage, attachment in ((GL_RGBA8, GL_COLOR_ATTACHMENT0), (GL_DEPTH_COMPONENT24, GL_DEPTH_ATTACHMENT)):
+        buffer = glGenRenderbuffers(1)
+        glBindRenderbuffer(GL_RENDERBUFFER, buffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, storage, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, attachment, GL_RENDERBUFFER, buffer)
+    glViewport(0, 0, width, height)
+    glEnable(GL_DEPTH_TEST)
+    return glGetString(GL_RENDERER).decode()
+
+def bench_render(frontend, params, samples, warmup):
+    from OpenGL.GL import glFinish
+    # Play by the frontend's rules, e.g. Mugunghwa's FREEZE_ON_RED and BULLET_HEIGHT
+    rules = {name: value for name, value in vars(frontend.game).items() if name.isupper()}
+    game = make_game(**params, rules=rules)
+    frontend.game = game
+    frontend.sim = Simulation(game)
+    frontend.loop = FixedStepLoop(frontend.sim)
+    phases = (('render.render_game_world', frontend.render_game_world), ('render.show_screen', frontend.show_screen))
+    results = {}
+    for name, draw in phases:
+        times = []
+        for i in range(warmup + samples):
+            refresh(game)
+            frontend.sim.step()
+            start = time.perf_counter()
+            draw()
+            # Software GL renders on the CPU, so wait for it to count the whole frame
+            glFinish()
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                times.append(elapsed)
+        results[name] = summarize(times)
+    return results
+
+def grid(args):
+    keys = ('level', 'npcs', 'obstacles', 'bullets')
+    for values in itertools.product(args.levels, args.npcs, args.obstacles, args.bullets):
+        yield dict(zip(keys, values))
+
+def run(args):
+    meta = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'samples': args.samples,
+        'frames': args.frames
+    }
+    frontend = None
+    if args.render:
+        if os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'):
+            frontend = load_frontend(args.frontend)
+            meta['gl_renderer'] = open_gl_context(frontend.game.WINDOW_WIDTH, frontend.game.WINDOW_HEIGHT)
+            meta['frontend'] = args.frontend
+        else:
+            print("No display, skipping render phases (try xvfb-run)", file=sys.stderr)
+    results = []
+    for params in grid(args):
+        phases = {}
+        phases.update(bench_tick(params, args.samples, args.warmup))
+        phases.update(bench_level(params, max(1, args.samples // 10), 1))
+        if frontend is not None:
+            phases.update(bench_render(frontend, params, args.frames, args.warmup_frames))
+        for phase, stats in phases.items():
+            results.append({'phase': phase, 'params': params, **stats})
+        if not args.quiet:
+            print(f"{params}: tick {phases['tick.tick']['median_ms']:.3f} ms", file=sys.stderr)
+    return {'meta': meta, 'results': results}
+
+def _key(result):
+    return result['phase'], tuple(sorted(result['params'].items()))
+
+def compare(report, baseline, threshold, min_delta):
+    """Pair each result with its baseline; returns (rows, regressions).
+
+    A regression is a median that grew by more than `threshold` as a fraction
+    and by more than `min_delta` milliseconds, so jitter on phases that take
+    a few microseconds does not fail the run.
+    """
+    previous = {_key(r): r for r in baseline['results']}
+    rows, regressions = [], []
+    for result in report['results']:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        row = {
+            'phase': result['phase'],
+            'params': result['params'],
+            'baseline_median_ms': old['median_ms'],
+            'median_ms': result['median_ms'],
+            'baseline_p99_ms': old['p99_ms'],
+            'p99_ms': result['p99_ms'],
+            'ratio': ratio
+        }
+        rows.append(row)
+        if ratio > 1 + threshold and result['median_ms'] - old['median_ms'] > min_delta:
+            regressions.append(row)
+    return rows, regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--npcs', type=int, nargs='+', default=[4, 100, 1000])
+    parser.add_argument('--obstacles', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--bullets', type=int, nargs='+', default=[0, 50])
+    parser.add_argument('--samples', type=int, default=500, help="ticks timed per configuration")
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--frames', type=int, default=60, help="frames timed per configuration")
+    parser.add_argument('--warmup-frames', type=int, default=5)
+    parser.add_argument('--no-render', dest='render', action='store_false')
+    parser.add_argument('--frontend', choices=sorted(FRONTENDS), default='grlightx')
+    parser.add_argument('-o', '--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="compare against a previously saved report")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="allowed median slowdown against the baseline, as a fraction")
+    parser.add_argument('--min-delta', type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many milliseconds")
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+    report = run(args)
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            rows, regressions = compare(report, json.load(f), args.threshold, args.min_delta)
+        report['comparison'] = {'threshold': args.threshold, 'min_delta': args.min_delta, 'rows': rows, 'regressions': len(regressions)}
+        for row in regressions:
+            print(f"REGRESSION {row['phase']} {row['params']}: "
+                  f"{row['baseline_median_ms']:.3f} -> {row['median_ms']:.3f} ms", file=sys.stderr)
+        status = 1 if regressions else 0
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Preallocated, array-backed bullet pool."""
+import numpy as np
+
+# Who fired a bullet, kept per slot so a hit can be attributed
+SPOTTER, OBSTACLE = 0, 1
+
+class BulletPool:
+    """Fixed-capacity bullet storage with a free list of slot indices.
+
+    Slots are recycled instead of allocating a new list per shot, and the
+    whole pool homes, hits and culls in one vectorized pass per tick.
+    """
+
+    def __init__(self, capacity=64):
+        self.pos = np.zeros((capacity, 3))
+        self.active = np.zeros(capacity, dtype=bool)
+        self.source = np.zeros(capacity, dtype=np.int8)
+        # Which player a bullet homes in on, for pools shared by several
+        self.target = np.zeros(capacity, dtype=np.int32)
+        self.hit_source = None
+        self._free = list(range(capacity - 1, -1, -1))
+        # Spawn points of bullets that have not moved yet, for O(1) duplicate checks
+        self._fresh = {}
+
+    def __len__(self):
+        return len(self.active) - len(self._free)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    @property
+    def capacity(self):
+        return len(self.active)
+
+    def _grow(self):
+        capacity = self.capacity
+        self.pos = np.concatenate((self.pos, np.zeros((capacity, 3))))
+        self.active = np.concatenate((self.active, np.zeros(capacity, dtype=bool)))
+        self.source = np.concatenate((self.source, np.zeros(capacity, dtype=np.int8)))
+        self.target = np.concatenate((self.target, np.zeros(capacity, dtype=np.int32)))
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def spawn(self, x, y, z=0, source=SPOTTER, target=0):
+        if not self._free:
+            self._grow()
+        i = self._free.pop()
+        self.pos[i] = (x, y, z)
+        self.active[i] = True
+        self.source[i] = source
+        self.target[i] = target
+        self._fresh[(x, y)] = self._fresh.get((x, y), 0) + 1
+        return i
+
+    def has_fresh_at(self, x, y):
+        return (x, y) in self._fresh
+
+    def positions(self):
+        return self.pos[self.active]
+
+    def clear(self):
+        self.active[:] = False
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._fresh.clear()
+
+    def update(self, target_x, target_y, speed, height=0):
+        """Home every bullet on the target; returns True if any of them hit.
+
+        The source of the first bullet to hit is left in hit_source.
+        """
+        self._fresh.clear()
+        idx = np.flatnonzero(self.active)
+        if not idx.size:
+            return False
+        hit = self._home(idx, target_x, target_y, speed, height)
+        if hit.any():
+            self.hit_source = int(self.source[idx[hit][0]])
+        return bool(hit.any())
+
+    def update_targets(self, xs, ys, alive, speed, height=0):
+        """Home each bullet on its own target among the points (xs, ys).
+
+        Bullets whose target is no longer alive are dropped. Returns the
+        targets and sources of the bullets that hit, in slot order.
+        """
+        self._fresh.clear()
+        idx = np.flatnonzero(self.active)
+        if not idx.size:
+            return idx, idx
+        target = self.target[idx]
+        hit = self._home(idx, xs[target], ys[target], speed, height, ~alive[target])
+        return target[hit], self.source[idx[hit]]
+
+    def _home(self, idx, target_x, target_y, speed, height, drop=False):
+        """Move the bullets in idx toward their targets and release those done; returns the hit mask."""
+        dx = target_x - self.pos[idx, 0]
+        dy = target_y - self.pos[idx, 1]
+        dist = np.sqrt(dx*dx + dy*dy)
+        hit = dist < 20
+        if drop is not False:
+            hit &= ~drop
+        done = hit | (dist > 2000) | drop
+        move = ~done
+        step = speed / dist[move]
+        moving = idx[move]
+        self.pos[moving, 0] += dx[move] * step
+        self.pos[moving, 1] += dy[move] * step
+        if height:
+            self.pos[moving, 2] = height
+        released = idx[done]
+        if released.size:
+            self.active[released] = False
+            self._free.extend(released.tolist())
+        return hit
@@ -0,0 +1,42 @@
+"""Pluggable time sources for the simulation.
+
+Every timer in the game reads clock.now(), and Simulation.step calls
+clock.advance(dt) once per tick. A virtual clock therefore ties game time
+to the tick count, which makes runs repeatable at any simulation speed.
+"""
+import time
+
+class RealClock:
+    """Wall-clock time; ticks do not move it."""
+
+    def now(self):
+        return time.monotonic()
+
+    def advance(self, dt):
+        pass
+
+class VirtualClock:
+    """Game time that only moves when the simulation ticks."""
+
+    def __init__(self, start=0.0):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def advance(self, dt):
+        self.time += dt
+
+class FastForwardClock:
+    """Wall-clock time sped up (or slowed down) by a constant factor."""
+
+    def __init__(self, speed=1.0, source=time.monotonic):
+        self.speed = speed
+        self.source = source
+        self.origin = source()
+
+    def now(self):
+        return (self.source() - self.origin) * self.speed
+
+    def advance(self, dt):
+        pass
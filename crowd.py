@@ -0,0 +1,68 @@
+"""Struct-of-arrays NPC crowd backed by NumPy."""
+import numpy as np
+
+from policies import assign, strides
+
+NPC_COLORS = np.array([
+    (0.2, 0.2, 0.8),
+    (0.8, 0.8, 0.2),
+    (0.8, 0.2, 0.8),
+    (0.2, 0.8, 0.8)
+])
+
+class Crowd:
+    """One array per NPC attribute, so the whole crowd updates in batch."""
+
+    def __init__(self, count, player_speed, rng, policy_mix=(1,)):
+        self.pos = np.zeros((count, 3))
+        self.pos[:, 0] = rng.integers(-100, 101, count)
+        self.pos[:, 1] = rng.integers(-100, 101, count)
+        self.angle = np.zeros(count)
+        self.speed = player_speed * rng.uniform(0.7, 1.3, count)
+        self.color = NPC_COLORS[np.arange(count) % len(NPC_COLORS)]
+        self.caught = np.zeros(count, dtype=bool)
+        self.finished = np.zeros(count, dtype=bool)
+        self.last_move_time = np.full(count, -np.inf)
+        self.move_delay = rng.uniform(0.5, 2.0, count)
+        self.last_angle_change = np.full(count, -np.inf)
+        self.angle_change_delay = rng.uniform(2.0, 5.0, count)
+        # Index into policies.POLICIES of what drives each NPC
+        self.policy = assign(count, policy_mix)
+
+    def __len__(self):
+        return len(self.pos)
+
+    @property
+    def active(self):
+        return ~(self.caught | self.finished)
+
+    def status(self, i):
+        return "Finished" if self.finished[i] else "Caught" if self.caught[i] else "Alive"
+
+    def counts(self):
+        finished = int(self.finished.sum())
+        caught = int((self.caught & ~self.finished).sum())
+        return len(self) - finished - caught, caught, finished
+
+def update_crowd(game, now):
+    npcs = game.npcs
+    active = npcs.active
+    ready = active & (now - npcs.last_move_time > npcs.move_delay)
+    stride = strides(game, npcs, ready, now)
+    idx = np.flatnonzero(stride)
+    if idx.size:
+        speed = npcs.speed[idx] * stride[idx]
+        npcs.pos[idx, 0] += speed
+        turning = idx[now - npcs.last_angle_change[idx] > npcs.angle_change_delay[idx]]
+        npcs.angle[turning] = game.np_rng.uniform(-15, 15, turning.size)
+        npcs.last_angle_change[turning] = now
+        npcs.angle_change_delay[turning] = game.np_rng.uniform(2.0, 5.0, turning.size)
+        npcs.pos[idx, 1] += np.sin(np.radians(npcs.angle[idx])) * speed * 0.5
+        npcs.last_move_time[idx] = now
+        npcs.move_delay[idx] = game.np_rng.uniform(0.1, 0.5, idx.size)
+        hit = idx[game.obstacle_grid.any_within(npcs.pos[idx, 0], npcs.pos[idx, 1], game.OBSTACLE_RADIUS)]
+        npcs.angle[hit] = 180
+        npcs.pos[hit, 0] -= 20
+        npcs.finished[idx[npcs.pos[idx, 0] >= game.GAME_LENGTH]] = True
+    npcs.pos[active, 0] = np.clip(npcs.pos[active, 0], -500, game.GAME_LENGTH)
+    npcs.pos[active, 1] = np.clip(npcs.pos[active, 1], -500, 500)
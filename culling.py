@@ -0,0 +1,33 @@
+"""View-frustum tests for bounding spheres."""
+import numpy as np
+from OpenGL.GL import *
+
+class Frustum:
+    """The six clip planes of a projection * view transform, normalized."""
+
+    def __init__(self, projection, modelview):
+        clip = np.asarray(projection, dtype=float) @ np.asarray(modelview, dtype=float)
+        planes = np.array([
+            clip[3] + clip[0], clip[3] - clip[0],
+            clip[3] + clip[1], clip[3] - clip[1],
+            clip[3] + clip[2], clip[3] - clip[2]
+        ])
+        self.planes = planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+        self.eye = np.linalg.inv(np.asarray(modelview, dtype=float))[:3, 3]
+
+    @classmethod
+    def from_gl(cls):
+        # glGetFloatv hands back column-major matrices
+        projection = np.asarray(glGetFloatv(GL_PROJECTION_MATRIX)).reshape(4, 4).T
+        modelview = np.asarray(glGetFloatv(GL_MODELVIEW_MATRIX)).reshape(4, 4).T
+        return cls(projection, modelview)
+
+    def test_spheres(self, centers, radii):
+        """Mask of spheres that are at least partly inside the frustum."""
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        distances = centers @ self.planes[:, :3].T + self.planes[:, 3]
+        return (distances >= -np.asarray(radii, dtype=float).reshape(-1, 1)).all(axis=1)
+
+    def distances(self, centers):
+        centers = np.asarray(centers, dtype=float).reshape(-1, 3)
+        return np.linalg.norm(centers - self.eye, axis=1)
@@ -0,0 +1,204 @@
+"""Cached HUD text drawn from a glyph atlas.
+
+Each GLUT bitmap font is rasterized once into an alpha texture. Strings
+are turned into textured quads the first time they are seen and reused
+until their text changes, and all text queued during a frame is drawn
+in one orthographic pass with a single draw call per font.
+"""
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GLUT import *
+
+FIRST_CHAR, LAST_CHAR = 32, 126
+COLUMNS = 16
+CELL_HEIGHT = 32
+BASELINE = 8
+PAD = 2
+MAX_CACHED_STRINGS = 512
+
+class GlyphAtlas:
+    """All printable ASCII glyphs of one bitmap font packed into a texture."""
+
+    def __init__(self, font):
+        self.font = font
+        self.texture = None
+
+    def build(self):
+        chars = range(FIRST_CHAR, LAST_CHAR + 1)
+        self.advance = np.zeros(256, dtype=np.float32)
+        for c in chars:
+            self.advance[c] = glutBitmapWidth(self.font, c)
+        self.cell_width = int(self.advance.max()) + 2 * PAD
+        rows = (len(chars) + COLUMNS - 1) // COLUMNS
+        self.size = (COLUMNS * self.cell_width, rows * CELL_HEIGHT)
+        pixels = self._rasterize(chars)
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_ALPHA, self.size[0], self.size[1], 0,
+                     GL_ALPHA, GL_UNSIGNED_BYTE, pixels)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def _cell(self, c):
+        i = c - FIRST_CHAR
+        return (i % COLUMNS) * self.cell_width, (i // COLUMNS) * CELL_HEIGHT
+
+    def _rasterize(self, chars):
+        """Draw every glyph into an offscreen framebuffer and read the coverage back."""
+        width, height = self.size
+        viewport = glGetIntegerv(GL_VIEWPORT)
+        previous = glGetIntegerv(GL_FRAMEBUFFER_BINDING)
+        fbo = glGenFramebuffers(1)
+        target = glGenRenderbuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+        glBindRenderbuffer(GL_RENDERBUFFER, target)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, target)
+        glViewport(0, 0, width, height)
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT | GL_CURRENT_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glClearColor(0, 0, 0, 0)
+        glClear(GL_COLOR_BUFFER_BIT)
+        _push_ortho(width, height)
+        glColor3f(1, 1, 1)
+        for c in chars:
+            x, y = self._cell(c)
+            glRasterPos2i(x + PAD, y + BASELINE)
+            glutBitmapCharacter(self.font, c)
+        _pop_ortho()
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        pixels = glReadPixels(0, 0, width, height, GL_RED, GL_UNSIGNED_BYTE)
+        glPopAttrib()
+        glBindFramebuffer(GL_FRAMEBUFFER, previous)
+        glViewport(*viewport)
+        glDeleteRenderbuffers(1, [target])
+        glDeleteFramebuffers(1, [fbo])
+        return pixels
+
+    def layout(self, string):
+        """Quads for a string at the origin, as (6 * len, 4) x/y/u/v rows."""
+        codes = np.frombuffer(string.encode('ascii', 'replace'), dtype=np.uint8).astype(int)
+        codes = np.where((codes < FIRST_CHAR) | (codes > LAST_CHAR), ord('?'), codes)
+        pen = np.concatenate(([0], np.cumsum(self.advance[codes])[:-1]))
+        index = codes - FIRST_CHAR
+        u0 = (index % COLUMNS) * self.cell_width / self.size[0]
+        v0 = (index // COLUMNS) * CELL_HEIGHT / self.size[1]
+        u1 = u0 + self.cell_width / self.size[0]
+        v1 = v0 + CELL_HEIGHT / self.size[1]
+        x0 = pen - PAD
+        x1 = x0 + self.cell_width
+        y0 = np.full(len(codes), -BASELINE, dtype=float)
+        y1 = y0 + CELL_HEIGHT
+        corners = [(x0, y0, u0, v0), (x1, y0, u1, v0), (x1, y1, u1, v1),
+                   (x0, y0, u0, v0), (x1, y1, u1, v1), (x0, y1, u0, v1)]
+        quads = np.stack([np.stack(c, axis=-1) for c in corners], axis=1)
+        return quads.reshape(-1, 4).astype(np.float32)
+
+def _push_ortho(width, height):
+    glMatrixMode(GL_PROJECTION)
+    glPushMatrix()
+    glLoadIdentity()
+    glOrtho(0, width, 0, height, -1, 1)
+    glMatrixMode(GL_MODELVIEW)
+    glPushMatrix()
+    glLoadIdentity()
+
+def _pop_ortho():
+    glPopMatrix()
+    glMatrixMode(GL_PROJECTION)
+    glPopMatrix()
+    glMatrixMode(GL_MODELVIEW)
+
+class TextRenderer:
+    """Queues HUD strings during a frame and draws them all in one pass."""
+
+    STRIDE = 8 * 4
+
+    def __init__(self):
+        self.atlases = {}
+        self.strings = {}
+        self.queue = []
+        self.fonts = {}
+        self.batch_key = None
+        self.batch = None
+
+    # GLUT font handles are module-level singletons and not always hashable,
+    # so caches are keyed on their identity
+
+    def atlas(self, font):
+        atlas = self.atlases.get(id(font))
+        if atlas is None:
+            atlas = self.atlases[id(font)] = GlyphAtlas(font)
+            atlas.build()
+        return atlas
+
+    def layout(self, string, font):
+        key = (id(font), string)
+        quads = self.strings.get(key)
+        if quads is None:
+            if len(self.strings) >= MAX_CACHED_STRINGS:
+                self.strings.clear()
+            quads = self.strings[key] = self.atlas(font).layout(string)
+        return quads
+
+    def add(self, x, y, string, font=GLUT_BITMAP_HELVETICA_18, color=(1, 1, 1, 1)):
+        if string:
+            self.queue.append((x, y, string, id(font), tuple(color)))
+            self.fonts[id(font)] = font
+
+    def _build_batch(self):
+        runs = []
+        for key in dict.fromkeys(item[3] for item in self.queue):
+            font = self.fonts[key]
+            parts = []
+            for x, y, string, item_font, color in self.queue:
+                if item_font != key:
+                    continue
+                quads = self.layout(string, font)
+                rows = np.empty((len(quads), 8), dtype=np.float32)
+                rows[:, :4] = quads
+                rows[:, 0] += x
+                rows[:, 1] += y
+                rows[:, 4:] = color
+                parts.append(rows)
+            runs.append((font, np.concatenate(parts)))
+        return runs
+
+    def flush(self, width, height):
+        """Draw and clear everything queued since the last flush."""
+        if not self.queue:
+            return
+        key = tuple(self.queue)
+        if key != self.batch_key:
+            self.batch_key = key
+            self.batch = self._build_batch()
+        self.queue = []
+        glPushAttrib(GL_ENABLE_BIT | GL_TEXTURE_BIT | GL_CURRENT_BIT | GL_COLOR_BUFFER_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_TEXTURE_2D)
+        glEnable(GL_ALPHA_TEST)
+        glAlphaFunc(GL_GREATER, 0)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        _push_ortho(width, height)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        for font, rows in self.batch:
+            glBindTexture(GL_TEXTURE_2D, self.atlas(font).texture)
+            pointer = rows.ctypes.data
+            glVertexPointer(2, GL_FLOAT, self.STRIDE, ctypes.c_void_p(pointer))
+            glTexCoordPointer(2, GL_FLOAT, self.STRIDE, ctypes.c_void_p(pointer + 8))
+            glColorPointer(4, GL_FLOAT, self.STRIDE, ctypes.c_void_p(pointer + 16))
+            glDrawArrays(GL_TRIANGLES, 0, len(rows))
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        _pop_ortho()
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glPopAttrib()
@@ -0,0 +1,176 @@
+"""Instanced drawing of the player, NPCs and bullets.
+
+Each mesh is uploaded once. Every frame the per-instance position,
+heading and colour of all actors is written into one instance buffer,
+and the whole crowd is drawn with one call per mesh regardless of size.
+"""
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+import meshes
+from lod import ACTOR_DETAIL, LodSettings
+
+PLAYER_COLOR = (0.8, 0.2, 0.2)
+BULLET_COLOR = (1, 0, 0)
+ACTOR_BOUNDS = (45, 45)
+BULLET_RADIUS = 5
+
+VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec3 color;
+attribute float tint;
+attribute vec4 instance;
+attribute vec3 instance_color;
+varying vec3 v_color;
+void main() {
+    float a = radians(instance.w);
+    float c = cos(a);
+    float s = sin(a);
+    vec3 p = vec3(c * position.x - s * position.y, s * position.x + c * position.y, position.z);
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(p + instance.xyz, 1.0);
+    v_color = mix(color, instance_color, tint);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 120
+varying vec3 v_color;
+void main() {
+    gl_FragColor = vec4(v_color, 1.0);
+}
+"""
+
+def _part(vertices, color, tint=0.0):
+    out = np.empty((len(vertices), 7), dtype=np.float32)
+    out[:, :3] = vertices
+    out[:, 3:6] = color
+    out[:, 6] = tint
+    return out
+
+def actor_mesh(slices=20, eye_slices=10, eyes=True):
+    """Body, head and eyes laid out as draw_player/draw_npc used to build them."""
+    parts = [
+        _part(meshes.sphere(20, slices, slices) + (0, 0, 35), (0, 0, 0), 1.0),
+        _part(meshes.sphere(15, slices, slices) + (0, 0, 65), (1, 0.8, 0.6))
+    ]
+    if eyes:
+        parts.append(_part(meshes.sphere(3, eye_slices, eye_slices) + (5, -15, 70), (0, 0, 0)))
+        parts.append(_part(meshes.sphere(3, eye_slices, eye_slices) + (-5, -15, 70), (0, 0, 0)))
+    return np.concatenate(parts)
+
+def bullet_mesh():
+    return _part(meshes.sphere(5, 10, 10), (0, 0, 0), 1.0)
+
+def actor_instances(game):
+    """One (x, y, z, angle, r, g, b) row per player, NPC and bullet, in that order."""
+    npcs = game.npcs
+    bullets = game.bullets.positions()
+    rows = np.empty((1 + len(npcs) + len(bullets), 7), dtype=np.float32)
+    rows[0, :3] = game.player_pos
+    rows[0, 3] = game.player_angle
+    rows[0, 4:] = PLAYER_COLOR
+    crowd = rows[1:1 + len(npcs)]
+    crowd[:, :3] = npcs.pos
+    crowd[:, 3] = npcs.angle
+    crowd[:, 4:] = npcs.color
+    shots = rows[1 + len(npcs):]
+    shots[:, :3] = bullets
+    shots[:, 3] = 0
+    shots[:, 4:] = BULLET_COLOR
+    return rows, 1 + len(npcs), len(bullets)
+
+class ActorRenderer:
+    MESH_STRIDE = 7 * 4
+    INSTANCE_STRIDE = 7 * 4
+
+    def __init__(self, lod=None):
+        self.lod = lod or LodSettings()
+        self.program = None
+        self.draw_calls = 0
+        self.culled = 0
+
+    def _upload_mesh(self, vertices):
+        vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        return vbo, len(vertices)
+
+    def _init_gl(self):
+        self.program = shaders.compileProgram(
+            shaders.compileShader(VERTEX_SHADER, GL_VERTEX_SHADER),
+            shaders.compileShader(FRAGMENT_SHADER, GL_FRAGMENT_SHADER),
+            validate=False
+        )
+        self.attribs = {
+            name: glGetAttribLocation(self.program, name)
+            for name in ('position', 'color', 'tint', 'instance', 'instance_color')
+        }
+        self.actor_meshes = [self._upload_mesh(actor_mesh(*detail)) for detail in ACTOR_DETAIL]
+        self.bullet_vbo, self.bullet_count = self._upload_mesh(bullet_mesh())
+        self.instance_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _bind_mesh(self, vbo):
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        for name, size, offset in (('position', 3, 0), ('color', 3, 12), ('tint', 1, 24)):
+            glVertexAttribPointer(self.attribs[name], size, GL_FLOAT, GL_FALSE,
+                                  self.MESH_STRIDE, ctypes.c_void_p(offset))
+
+    def _bind_instances(self, first):
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        base = first * self.INSTANCE_STRIDE
+        glVertexAttribPointer(self.attribs['instance'], 4, GL_FLOAT, GL_FALSE,
+                              self.INSTANCE_STRIDE, ctypes.c_void_p(base))
+        glVertexAttribPointer(self.attribs['instance_color'], 3, GL_FLOAT, GL_FALSE,
+                              self.INSTANCE_STRIDE, ctypes.c_void_p(base + 16))
+
+    def cull(self, rows, actors, frustum):
+        centers = rows[:, :3].astype(float)
+        centers[:actors, 2] += ACTOR_BOUNDS[0]
+        radii = np.full(len(rows), BULLET_RADIUS, dtype=float)
+        radii[:actors] = ACTOR_BOUNDS[1]
+        keep = frustum.test_spheres(centers, radii)
+        self.culled = int(len(rows) - keep.sum())
+        return rows[keep], int(keep[:actors].sum()), int(keep[actors:].sum())
+
+    def draw(self, game, frustum=None):
+        if self.program is None:
+            self._init_gl()
+        rows, actors, bullets = actor_instances(game)
+        self.culled = 0
+        batches = [(0, actors)]
+        if frustum is not None:
+            rows, actors, bullets = self.cull(rows, actors, frustum)
+            levels = self.lod.actor_levels(frustum.distances(rows[:actors, :3]))
+            order = np.argsort(levels, kind='stable')
+            rows[:actors] = rows[:actors][order]
+            sizes = np.bincount(levels, minlength=len(ACTOR_DETAIL))
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            batches = list(zip(starts.tolist(), sizes.tolist()))
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, rows.nbytes, rows, GL_STREAM_DRAW)
+        glUseProgram(self.program)
+        for location in self.attribs.values():
+            glEnableVertexAttribArray(location)
+        glVertexAttribDivisor(self.attribs['instance'], 1)
+        glVertexAttribDivisor(self.attribs['instance_color'], 1)
+        self.draw_calls = 0
+        draws = [mesh + batch for mesh, batch in zip(self.actor_meshes, batches)]
+        draws.append((self.bullet_vbo, self.bullet_count, actors, bullets))
+        for vbo, count, first, instances in draws:
+            if not instances:
+                continue
+            self._bind_mesh(vbo)
+            self._bind_instances(first)
+            glDrawArraysInstanced(GL_TRIANGLES, 0, count, instances)
+            self.draw_calls += 1
+        glVertexAttribDivisor(self.attribs['instance'], 0)
+        glVertexAttribDivisor(self.attribs['instance_color'], 0)
+        for location in self.attribs.values():
+            glDisableVertexAttribArray(location)
+        glUseProgram(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
@@ -0,0 +1,242 @@
+"""Whole levels saved to and loaded from a compact binary file.
+
+    header:  magic, version, array count, metadata length
+    metadata JSON: level number, seed and run, tuning, derived values and
+             the scalar fields of the crowd, obstacle index and sight map
+    table:   name, dtype, shape and file offset of every array
+    arrays:  raw little-endian data, each aligned to 64 bytes
+
+There is one array per entity attribute: obstacle and tree positions, the
+obstacle grid's index, the spotter's sight depths and every NPC field,
+plus the generator state at the start of the level. A streamed level
+instead stores every chunk's obstacles and trees back to back with the
+offset of each chunk, and chunks are read as the player reaches them.
+Loading maps the file
+copy-on-write and hands out views into it, so even a huge arena is ready
+without parsing or copying, processes loading the same file share its
+pages, and nothing a game does to its NPCs ever reaches the file.
+
+    python levels.py arena.lvl --seed 7 --level 5 --npcs 10000
+    python levels.py --info arena.lvl
+"""
+import argparse
+import json
+import random
+import struct
+import sys
+
+import numpy as np
+
+from crowd import Crowd
+from occlusion import SightMap
+from simulation import DERIVED, RULES, GameState, Level
+from spatial import SpatialGrid
+from world import StreamedWorld
+
+MAGIC = b'RLLV'
+VERSION = 2
+ALIGN = 64
+
+_HEADER = struct.Struct('<4sHHI')
+_ARRAY = struct.Struct('<32s4sBxxxQQQ')
+
+# Attributes of these objects are stored as arrays or metadata by name
+_PARTS = {'npcs': Crowd, 'obstacle_grid': SpatialGrid, 'sight': SightMap}
+
+def _split(obj, skip=()):
+    """An object's attributes divided into arrays and JSON-safe values."""
+    arrays, values = {}, {}
+    for name, value in vars(obj).items():
+        if name in skip:
+            continue
+        if isinstance(value, np.ndarray):
+            arrays[name] = value
+        else:
+            values[name] = value
+    return arrays, values
+
+def _restore(cls, arrays, values):
+    """An instance of cls with the given attributes, without running __init__."""
+    obj = cls.__new__(cls)
+    vars(obj).update(values)
+    vars(obj).update(arrays)
+    return obj
+
+def _chunk_arrays(world):
+    """Every chunk of a streamed world, generated now, as back-to-back arrays and offsets."""
+    obstacles, trees = [], []
+    for index in range(world.first, world.last + 1):
+        chunk_obstacles, chunk_trees = world.source(index)
+        obstacles.append(np.asarray(chunk_obstacles, dtype=float).reshape(-1, 2))
+        trees.append(np.asarray(chunk_trees, dtype=float).reshape(-1, 2))
+    return {
+        'chunks.obstacles': np.concatenate(obstacles),
+        'chunks.obstacle_start': np.cumsum([0] + [len(a) for a in obstacles]),
+        'chunks.trees': np.concatenate(trees),
+        'chunks.tree_start': np.cumsum([0] + [len(a) for a in trees])
+    }
+
+def _chunk_source(world, arrays):
+    """Reads chunks out of the mapped arrays, so only the pages of chunks visited are touched."""
+    obstacles, obstacle_start = arrays['chunks.obstacles'], arrays['chunks.obstacle_start']
+    trees, tree_start = arrays['chunks.trees'], arrays['chunks.tree_start']
+
+    def source(index):
+        i = index - world.first
+        return (obstacles[obstacle_start[i]:obstacle_start[i + 1]],
+                trees[tree_start[i]:tree_start[i + 1]])
+    return source
+
+def save(level, path):
+    """Write a Level as generated; it must not have been played yet."""
+    if level.used:
+        raise ValueError("level has already been played")
+    rng_version, rng_state, gauss_next = level.rng.getstate()
+    arrays = {'rng': np.asarray(rng_state, dtype='<u4')}
+    meta = {
+        'level': level.current_level,
+        'seed': level.seed,
+        'run': level.run,
+        'tuning': level.tuning,
+        'derived': {name: getattr(level, name) for name in DERIVED},
+        'level_seed': level.level_seed,
+        'spotter_pos': list(level.spotter_pos),
+        'rng': [rng_version, gauss_next],
+        'np_rng': level.np_rng.bit_generator.state
+    }
+    if level.world is not None:
+        # The resident obstacles, grid and sight lines are rebuilt from the chunks
+        parts = ('npcs',)
+        arrays.update(_chunk_arrays(level.world))
+    else:
+        parts = _PARTS
+        arrays['trees'] = np.asarray(level.trees, dtype=float).reshape(-1, 2)
+    for part in parts:
+        # The obstacle grid keeps the obstacle positions, the sight map's grid is only needed to build it
+        part_arrays, meta[part] = _split(getattr(level, part), skip=('grid',))
+        arrays.update((f'{part}.{name}', value) for name, value in part_arrays.items())
+    encoded = json.dumps(meta, separators=(',', ':')).encode()
+    offset = _HEADER.size + len(encoded) + _ARRAY.size * len(arrays)
+    table = bytearray()
+    blobs = []
+    for name, value in arrays.items():
+        value = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder('<'))
+        offset += -offset % ALIGN
+        rows, cols = (value.shape + (0, 0))[:2]
+        table += _ARRAY.pack(name.encode('ascii'), value.dtype.str.encode('ascii'), value.ndim, rows, cols, offset)
+        blobs.append((offset, value))
+        offset += value.nbytes
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(arrays), len(encoded)))
+        f.write(encoded)
+        f.write(table)
+        for start, value in blobs:
+            f.write(b'\0' * (start - f.tell()))
+            f.write(value.tobytes())
+
+def _read(path):
+    """Metadata and array views of a level file, mapped copy-on-write."""
+    data = np.memmap(path, mode='c')
+    magic, version, count, length = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a level file")
+    if version != VERSION:
+        raise ValueError(f"unsupported level version {version}")
+    offset = _HEADER.size
+    meta = json.loads(bytes(data[offset:offset + length]))
+    offset += length
+    arrays = {}
+    for _ in range(count):
+        name, dtype, ndim, rows, cols, start = _ARRAY.unpack_from(data, offset)
+        offset += _ARRAY.size
+        dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+        shape = (rows, cols)[:ndim]
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        arrays[name.rstrip(b'\0').decode('ascii')] = data[start:start + size].view(dtype).reshape(shape)
+    return meta, arrays
+
+def load(path):
+    """The Level stored in a file, ready for start()."""
+    meta, arrays = _read(path)
+    level = Level.__new__(Level)
+    # Files from before RULES was split off also carry the rules they were made under
+    level.tuning = {name: tuple(value) if isinstance(value, list) else value
+                    for name, value in meta['tuning'].items() if name not in RULES}
+    vars(level).update(level.tuning)
+    vars(level).update(meta['derived'])
+    level.seed = meta['seed']
+    level.run = meta['run']
+    level.current_level = meta['level']
+    level.used = False
+    level.level_seed = meta['level_seed']
+    level.spotter_pos = meta['spotter_pos']
+    rng_version, gauss_next = meta['rng']
+    level.rng = random.Random()
+    level.rng.setstate((rng_version, tuple(arrays['rng'].tolist()), gauss_next))
+    level.np_rng = np.random.default_rng()
+    level.np_rng.bit_generator.state = meta['np_rng']
+    for part, cls in _PARTS.items():
+        if part not in meta:
+            continue
+        prefix = part + '.'
+        part_arrays = {name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)}
+        setattr(level, part, _restore(cls, part_arrays, meta[part]))
+    if 'chunks.obstacles' in arrays:
+        level.world = StreamedWorld(level)
+        level.world.source = _chunk_source(level.world, arrays)
+        level.chunk_window = level.world.window(0)
+        (level.chunks, level.obstacles, level.trees, level.obstacle_grid,
+         level.sight) = level.world.assemble(level.chunk_window)
+    else:
+        level.world = level.chunks = level.chunk_window = None
+        level.obstacle_grid.shape = tuple(level.obstacle_grid.shape)
+        level.sight.grid = None
+        level.obstacles = level.obstacle_grid.points
+        level.trees = arrays['trees']
+    return level
+
+def start(game, level):
+    """Play a loaded level in the game, adopting its seed, run and tuning.
+
+    The tuning is only what generation and difficulty depend on, so the
+    game keeps its frontend's RULES. Later levels are generated from the
+    same seed as usual.
+    """
+    vars(game).update(level.tuning)
+    game.seed = level.seed
+    game.run = level.run
+    game.current_level = level.current_level
+    game.reset_level(level)
+
+def info(path):
+    meta, arrays = _read(path)
+    return {
+        'level': meta['level'],
+        'seed': meta['seed'],
+        'run': meta['run'],
+        'derived': meta['derived'],
+        'arrays': {name: f'{value.dtype.str} {value.shape}' for name, value in arrays.items()}
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a level and save it, or describe a saved one.")
+    parser.add_argument('path')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--run', type=int, default=0)
+    parser.add_argument('--level', type=int, default=1)
+    parser.add_argument('--npcs', type=int, help="NPC count instead of the default")
+    parser.add_argument('--length', type=int, help="length of level 1 instead of the default")
+    parser.add_argument('--info', action='store_true', help="only describe an existing level file")
+    args = parser.parse_args(argv)
+    if not args.info:
+        game = GameState(seed=args.seed)
+        if args.npcs is not None:
+            game.NPC_COUNT = args.npcs
+        if args.length is not None:
+            game.BASE_GAME_LENGTH = args.length
+        save(Level(game, args.level, args.run), args.path)
+    json.dump(info(args.path), sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Distance-based level-of-detail selection."""
+import numpy as np
+
+class LodSettings:
+    """Camera distances at which meshes switch to cheaper versions.
+
+    Each tuple holds ascending thresholds; an object at distance d gets
+    level = number of thresholds it is beyond, so level 0 is full detail.
+    Lower the distances to trade quality for frame rate on weak hardware.
+    """
+
+    def __init__(self, actor_distances=(600, 1500), tree_distances=(800, 1800)):
+        # Actors: reduced tessellation, then no eyes or mouth
+        self.actor_distances = tuple(actor_distances)
+        # Trees: reduced canopy, then billboard impostor
+        self.tree_distances = tuple(tree_distances)
+
+    def scaled(self, factor):
+        return LodSettings(
+            [d * factor for d in self.actor_distances],
+            [d * factor for d in self.tree_distances]
+        )
+
+    def actor_levels(self, distances):
+        return np.searchsorted(self.actor_distances, distances, side='right')
+
+    def tree_levels(self, distances):
+        return np.searchsorted(self.tree_distances, distances, side='right')
+
+    def actor_level(self, distance):
+        return int(self.actor_levels([distance])[0])
+
+# (slices/stacks of body and head, of eyes or mouth, whether eyes are drawn) per actor level
+ACTOR_DETAIL = (
+    (20, 10, True),
+    (10, 6, True),
+    (6, 4, False)
+)
@@ -0,0 +1,64 @@
+"""Triangle meshes matching the GLUT solids used by the renderer.
+
+Meshes are plain (N, 3) float32 vertex arrays, three vertices per
+triangle, so they can be baked into vertex buffers without needing GLUT.
+"""
+import numpy as np
+
+def sphere(radius, slices, stacks):
+    theta = np.linspace(0, 2 * np.pi, slices + 1)
+    phi = np.linspace(0, np.pi, stacks + 1)
+    ring = np.stack([
+        np.outer(np.sin(phi), np.cos(theta)),
+        np.outer(np.sin(phi), np.sin(theta)),
+        np.outer(np.cos(phi), np.ones_like(theta))
+    ], axis=-1) * radius
+    a = ring[:-1, :-1]
+    b = ring[1:, :-1]
+    c = ring[1:, 1:]
+    d = ring[:-1, 1:]
+    quads = np.stack([a, b, c, a, c, d], axis=2)
+    return quads.reshape(-1, 3).astype(np.float32)
+
+def cube(size):
+    h = size / 2
+    corners = np.array([
+        (-h, -h, -h), (h, -h, -h), (h, h, -h), (-h, h, -h),
+        (-h, -h, h), (h, -h, h), (h, h, h), (-h, h, h)
+    ])
+    faces = [
+        (0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4),
+        (2, 3, 7, 6), (1, 2, 6, 5), (0, 4, 7, 3)
+    ]
+    tris = [(f[0], f[1], f[2], f[0], f[2], f[3]) for f in faces]
+    return corners[np.array(tris).ravel()].astype(np.float32)
+
+def quad(a, b, c, d):
+    return np.array([a, b, c, a, c, d], dtype=np.float32)
+
+def disc(radius, segments, center, axis):
+    """Flat vertical polygon facing along axis ('x' or 'y'), as a triangle fan."""
+    angles = np.linspace(0, 2 * np.pi, segments + 1)
+    ring = np.zeros((segments + 1, 3))
+    ring[:, 1 if axis == 'x' else 0] = np.cos(angles) * radius
+    ring[:, 2] = np.sin(angles) * radius
+    ring += center
+    fan = np.empty((segments, 3, 3))
+    fan[:, 0] = center
+    fan[:, 1] = ring[:-1]
+    fan[:, 2] = ring[1:]
+    return fan.reshape(-1, 3).astype(np.float32)
+
+def colored(vertices, color):
+    """Interleave a mesh with a constant colour as (N, 6) xyz/rgb rows."""
+    out = np.empty((len(vertices), 6), dtype=np.float32)
+    out[:, :3] = vertices
+    out[:, 3:] = color
+    return out
+
+def tile(mesh, offsets):
+    """Copies of an interleaved mesh translated to each (x, y, z) offset."""
+    offsets = np.asarray(offsets, dtype=np.float32).reshape(-1, 3)
+    out = np.repeat(mesh[None], len(offsets), axis=0)
+    out[:, :, :3] += offsets[:, None, :]
+    return out.reshape(-1, mesh.shape[1])
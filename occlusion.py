@@ -0,0 +1,192 @@
+"""Line of sight through obstacles and trees.
+
+Blockers are rasterized once per level into a boolean occupancy grid,
+which rays cross cell by cell with a DDA traversal (Amanatides & Woo),
+all rays advancing together in NumPy. The spotter never moves within a
+level, so a SightMap casts one ray per angular bin from it up front and
+keeps the distance to the first blocked cell. Testing an actor is then a
+table lookup and a distance compare, however many actors there are.
+"""
+import math
+
+import numpy as np
+
+# Footprints of what blocks the view: obstacle cubes are 40 units across,
+# tree trunks are 10 wide under a canopy of radius 25
+OBSTACLE_HALF_SIZE = 20
+TREE_RADIUS = 12
+
+class OcclusionGrid:
+    """Occupancy of square cells covering the given bounds."""
+
+    def __init__(self, bounds, cell_size=10):
+        (x0, y0), (x1, y1) = bounds
+        self.origin = np.array((x0, y0), dtype=float)
+        self.cell_size = float(cell_size)
+        self.shape = (int(math.ceil((x1 - x0) / cell_size)) + 1, int(math.ceil((y1 - y0) / cell_size)) + 1)
+        self.cells = np.zeros(self.shape, dtype=bool)
+
+    def _centers(self, x, y, reach):
+        """Cell index ranges and center coordinates of the cells within reach of (x, y)."""
+        cs = self.cell_size
+        lo = np.floor((np.array((x, y)) - reach - self.origin) / cs).astype(int)
+        hi = np.floor((np.array((x, y)) + reach - self.origin) / cs).astype(int) + 1
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self.shape)
+        cx = self.origin[0] + (np.arange(lo[0], hi[0]) + 0.5) * cs
+        cy = self.origin[1] + (np.arange(lo[1], hi[1]) + 0.5) * cs
+        return lo, hi, cx, cy
+
+    def add_boxes(self, points, half_size):
+        for x, y in points:
+            lo, hi, cx, cy = self._centers(x, y, half_size)
+            inside = (np.abs(cx - x) <= half_size)[:, None] & (np.abs(cy - y) <= half_size)[None, :]
+            self.cells[lo[0]:hi[0], lo[1]:hi[1]] |= inside
+
+    def add_circles(self, points, radius):
+        for x, y in points:
+            lo, hi, cx, cy = self._centers(x, y, radius)
+            inside = (cx - x)[:, None] ** 2 + (cy - y)[None, :] ** 2 <= radius * radius
+            self.cells[lo[0]:hi[0], lo[1]:hi[1]] |= inside
+
+    def _entry(self, fx, fy, dx, dy):
+        """Distance along each ray from a point outside the grid to where it enters, inf if it misses."""
+        enter = np.zeros(dx.size)
+        leave = np.full(dx.size, np.inf)
+        for f, d, size in ((fx, dx, self.shape[0]), (fy, dy, self.shape[1])):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                a = -f * self.cell_size / d
+                b = (size - f) * self.cell_size / d
+            within = 0 <= f < size
+            enter = np.maximum(enter, np.where(d == 0, -np.inf if within else np.inf, np.minimum(a, b)))
+            leave = np.minimum(leave, np.where(d == 0, np.inf if within else -np.inf, np.maximum(a, b)))
+        return np.where(enter < leave, enter, np.inf)
+
+    def first_hit(self, ox, oy, dx, dy, max_distance):
+        """Distance along each ray to the first occupied cell, or inf if none is reached.
+
+        Rays start at (ox, oy) and run along the unit vectors (dx, dy). The
+        cell containing the origin is not tested, so a viewer is never
+        blocked by what it stands in. From an origin outside the grid, rays
+        are clipped to where they enter it and the cell they enter through
+        is tested.
+        """
+        dx = np.asarray(dx, dtype=float)
+        dy = np.asarray(dy, dtype=float)
+        n = dx.size
+        cs = self.cell_size
+        nx, ny = self.shape
+        result = np.full(n, np.inf)
+        limit = np.broadcast_to(np.asarray(max_distance, dtype=float), (n,))
+        fx = (ox - self.origin[0]) / cs
+        fy = (oy - self.origin[1]) / cs
+        if 0 <= fx < nx and 0 <= fy < ny:
+            start = np.zeros(n)
+            gx = np.full(n, math.floor(fx))
+            gy = np.full(n, math.floor(fy))
+            active = np.ones(n, dtype=bool)
+        else:
+            start = self._entry(fx, fy, dx, dy)
+            active = start <= limit
+            start = np.where(active, start, 0)
+            fx = fx + start * dx / cs
+            fy = fy + start * dy / cs
+            gx = np.clip(np.floor(fx), 0, nx - 1).astype(int)
+            gy = np.clip(np.floor(fy), 0, ny - 1).astype(int)
+            hit = active & self.cells[gx, gy]
+            result[hit] = start[hit]
+            active &= ~hit
+        step_x = np.where(dx > 0, 1, -1)
+        step_y = np.where(dy > 0, 1, -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta_x = np.where(dx != 0, cs / np.abs(dx), np.inf)
+            delta_y = np.where(dy != 0, cs / np.abs(dy), np.inf)
+            # Distance to the first vertical and horizontal cell boundary
+            next_x = np.where(dx > 0, gx + 1 - fx, fx - gx) * delta_x + start
+            next_y = np.where(dy > 0, gy + 1 - fy, fy - gy) * delta_y + start
+        next_x = np.where(np.isnan(next_x), np.inf, next_x)
+        next_y = np.where(np.isnan(next_y), np.inf, next_y)
+        rays = np.flatnonzero(active)
+        gx, gy, limit = gx[active], gy[active], limit[active]
+        step_x, step_y = step_x[active], step_y[active]
+        delta_x, delta_y = delta_x[active], delta_y[active]
+        next_x, next_y = next_x[active], next_y[active]
+        while rays.size:
+            along_x = next_x < next_y
+            t = np.where(along_x, next_x, next_y)
+            gx += np.where(along_x, step_x, 0)
+            gy += np.where(along_x, 0, step_y)
+            next_x = np.where(along_x, next_x + delta_x, next_x)
+            next_y = np.where(along_x, next_y, next_y + delta_y)
+            inside = (t <= limit) & (gx >= 0) & (gx < nx) & (gy >= 0) & (gy < ny)
+            hit = np.zeros(rays.size, dtype=bool)
+            hit[inside] = self.cells[gx[inside], gy[inside]]
+            result[rays[hit]] = t[hit]
+            keep = inside & ~hit
+            rays, gx, gy, limit = rays[keep], gx[keep], gy[keep], limit[keep]
+            step_x, step_y = step_x[keep], step_y[keep]
+            delta_x, delta_y = delta_x[keep], delta_y[keep]
+            next_x, next_y = next_x[keep], next_y[keep]
+        return result
+
+    def visible(self, ox, oy, xs, ys):
+        """Whether each point can be seen from (ox, oy)."""
+        dx = np.asarray(xs, dtype=float) - ox
+        dy = np.asarray(ys, dtype=float) - oy
+        distance = np.hypot(dx, dy)
+        safe = np.where(distance > 0, distance, 1)
+        return distance < self.first_hit(ox, oy, dx / safe, dy / safe, distance)
+
+class SightMap:
+    """Distance to the nearest blocker in every direction from a fixed viewpoint."""
+
+    def __init__(self, grid, x, y, bins=2048, region=None):
+        self.grid = grid
+        self.x, self.y = x, y
+        self.bins = bins
+        self.depth = np.full(bins, np.inf)
+        index = self._bins_toward(region)
+        angles = (index + 0.5) * (2 * math.pi / bins)
+        (width, height) = grid.shape
+        reach = math.hypot(width, height) * grid.cell_size
+        self.depth[index] = grid.first_hit(x, y, np.cos(angles), np.sin(angles), reach)
+
+    def _bins_toward(self, region):
+        """Bins whose rays can reach the ((x0, y0), (x1, y1)) region; all of them if it is None."""
+        if region is None:
+            return np.arange(self.bins)
+        (x0, y0), (x1, y1) = region
+        if x0 <= self.x <= x1 and y0 <= self.y <= y1:
+            return np.arange(self.bins)
+        center = math.atan2((y0 + y1) / 2 - self.y, (x0 + x1) / 2 - self.x)
+        offsets = [(math.atan2(cy - self.y, cx - self.x) - center + math.pi) % (2 * math.pi) - math.pi
+                   for cx in (x0, x1) for cy in (y0, y1)]
+        width = 2 * math.pi / self.bins
+        first = math.floor((center + min(offsets)) / width)
+        count = math.ceil((max(offsets) - min(offsets)) / width) + 2
+        return (first + np.arange(count)) % self.bins
+
+    @classmethod
+    def for_game(cls, game, cell_size=10, bins=2048):
+        """Sight lines from the spotter past the level's obstacles and trees."""
+        # Lists for generated levels, arrays for streamed and loaded ones
+        blockers = np.concatenate([np.reshape(game.obstacles, (-1, 2)), np.reshape(game.trees, (-1, 2)),
+                                   [game.spotter_pos[:2]]]).astype(float)
+        low = blockers.min(axis=0) - 50
+        high = blockers.max(axis=0) + 50
+        low = np.minimum(low, (-550, -550))
+        high = np.maximum(high, (game.GAME_LENGTH + 50, 550))
+        grid = OcclusionGrid((low, high), cell_size)
+        grid.add_boxes(game.obstacles, OBSTACLE_HALF_SIZE)
+        grid.add_circles(game.trees, TREE_RADIUS)
+        # Players and NPCs are clamped to this area, so only rays into it are cast
+        field = ((-500, -500), (game.GAME_LENGTH, 500))
+        return cls(grid, game.spotter_pos[0], game.spotter_pos[1], bins, field)
+
+    def visible(self, xs, ys):
+        """Whether each point has a clear line to the viewpoint."""
+        dx = np.asarray(xs, dtype=float) - self.x
+        dy = np.asarray(ys, dtype=float) - self.y
+        angle = np.arctan2(dy, dx) % (2 * math.pi)
+        index = np.minimum((angle * (self.bins / (2 * math.pi))).astype(int), self.bins - 1)
+        return np.hypot(dx, dy) < self.depth[index]
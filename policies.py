@@ -0,0 +1,85 @@
+"""NPC behaviour policies, each evaluated for all its NPCs at once.
+
+Every NPC follows one policy, fixed when the crowd is created. Once per
+tick each policy present gets the Observations of its NPCs, arrays of
+what they can know, and returns every one's stride as a multiple of its
+speed, 0 to stand still. Moving, turning, bouncing off obstacles and
+finishing are the same for everyone, see crowd.update_crowd.
+
+    wander    the original random walk: a stride whenever ready on green
+    cautious  only moves early in a green light, never near its end
+    reckless  ignores the light altogether and takes longer strides
+    watcher   moves on green, and on red sneaks wherever the spotter's
+              head is turned away from it
+"""
+import numpy as np
+
+from vision import NPC_DETECTION_ANGLE, cone_cosine, seen
+
+WANDER, CAUTIOUS, RECKLESS, WATCHER = range(4)
+POLICIES = ('wander', 'cautious', 'reckless', 'watcher')
+
+# Greens last at least a second, so this much of one is always safe
+CAUTIOUS_GREEN = 0.8
+RECKLESS_STRIDE = 1.3
+WATCHER_STRIDE = 0.5
+# Degrees beyond the view cone a watcher keeps clear of; it also allows
+# for how far the head turns while a step still counts as moving
+WATCHER_MARGIN = 10
+
+class Observations:
+    """What the NPCs of one policy know this tick, one entry per NPC where it varies."""
+
+    def __init__(self, game, npcs, members, ready, now):
+        self.game = game
+        self.green = game.spotter_state == "green"
+        self.light_age = now - game.last_state_change
+        self.ready = ready[members]
+        self.npcs = npcs
+        self.members = members
+
+    def watched(self, margin=0):
+        """Mask of the NPCs the spotter would see with its view cone widened by margin degrees."""
+        pos = self.npcs.pos[self.members]
+        return seen(self.game, pos[:, 0], pos[:, 1], cone_cosine(NPC_DETECTION_ANGLE + margin))
+
+def wander(obs):
+    return np.where(obs.ready & obs.green, 1.0, 0.0)
+
+def cautious(obs):
+    return np.where(obs.ready & obs.green & (obs.light_age < CAUTIOUS_GREEN), 1.0, 0.0)
+
+def reckless(obs):
+    return np.where(obs.ready, RECKLESS_STRIDE, 0.0)
+
+def watcher(obs):
+    if obs.green:
+        return wander(obs)
+    game = obs.game
+    # Movement is caught for 0.1 s after a step, while the head keeps turning
+    margin = WATCHER_MARGIN + abs(game.SPOTTER_TURN_SPEED) * game.TICK_RATE * 0.1
+    return np.where(obs.ready & ~obs.watched(margin), WATCHER_STRIDE, 0.0)
+
+ACTIONS = (wander, cautious, reckless, watcher)
+
+def assign(count, mix):
+    """Policy of each of count NPCs, in the shares given per policy by mix.
+
+    Goes by index, so no random numbers are drawn and crowds of pure
+    wanderers come out as they always have.
+    """
+    weights = np.asarray(mix, dtype=float)
+    bounds = np.cumsum(weights) / weights.sum()
+    policy = np.searchsorted(bounds, (np.arange(count) + 0.5) / count, side='right')
+    return np.minimum(policy, weights.size - 1).astype(np.int8)
+
+def strides(game, npcs, ready, now):
+    """Stride of every NPC this tick as a multiple of its speed, 0 to stand still."""
+    codes = np.flatnonzero(np.bincount(npcs.policy, minlength=len(ACTIONS)))
+    if codes.size == 1:
+        return ACTIONS[codes[0]](Observations(game, npcs, slice(None), ready, now))
+    stride = np.zeros(len(npcs))
+    for code in codes:
+        members = np.flatnonzero(npcs.policy == code)
+        stride[members] = ACTIONS[code](Observations(game, npcs, members, ready, now))
+    return stride
@@ -0,0 +1,130 @@
+"""Lightweight per-phase timing for the game loop.
+
+Phases are timed with `with profiler.section(name):`. While the profiler
+is disabled, section() hands back one shared no-op context manager, so
+instrumented code pays little more than a method call. Each phase keeps
+its last `window` samples in a ring buffer, from which the overlay and
+dumps derive means, percentiles and a histogram.
+"""
+import json
+import time
+
+import numpy as np
+
+# Histogram bucket edges in milliseconds
+BUCKETS_MS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullSection()
+
+class _Section:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.profiler.clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.profiler.clock() - self.start)
+        return False
+
+class Phase:
+    """Ring buffer of the most recent durations of one phase, in seconds."""
+
+    def __init__(self, window):
+        self.samples = np.zeros(window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+
+    def recent(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def stats(self):
+        ms = self.recent() * 1000
+        if not ms.size:
+            return None
+        counts = np.bincount(np.searchsorted(BUCKETS_MS, ms), minlength=len(BUCKETS_MS) + 1)
+        return {
+            'mean_ms': float(ms.mean()),
+            'median_ms': float(np.median(ms)),
+            'p99_ms': float(np.percentile(ms, 99)),
+            'max_ms': float(ms.max()),
+            'samples': int(ms.size),
+            'histogram': counts.tolist()
+        }
+
+class Profiler:
+    def __init__(self, enabled=False, window=240, clock=time.perf_counter):
+        self.enabled = enabled
+        self.window = window
+        self.clock = clock
+        self.phases = {}
+        self.last_frame = None
+
+    def section(self, name):
+        return _Section(self, name) if self.enabled else _NULL
+
+    def add(self, name, seconds):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(self.window)
+        phase.add(seconds)
+
+    def frame(self):
+        """Mark the start of a displayed frame; the gap since the last one is the frame time."""
+        if not self.enabled:
+            return
+        now = self.clock()
+        if self.last_frame is not None:
+            self.add('frame', now - self.last_frame)
+        self.last_frame = now
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.last_frame = None
+        return self.enabled
+
+    def mean_ms(self, name):
+        phase = self.phases.get(name)
+        if phase is None or not phase.count:
+            return 0.0
+        return float(phase.recent().mean() * 1000)
+
+    def top(self, n=5, exclude=('frame', 'tick')):
+        """The n phases with the highest mean time, as (name, mean_ms) pairs."""
+        means = [(name, self.mean_ms(name)) for name in self.phases if name not in exclude]
+        return sorted(means, key=lambda item: item[1], reverse=True)[:n]
+
+    def overlay_lines(self, n=5):
+        frame = self.mean_ms('frame')
+        fps = 1000 / frame if frame else 0
+        lines = [f"Frame: {frame:.2f} ms ({fps:.0f} fps)", f"Tick: {self.mean_ms('tick'):.3f} ms"]
+        lines += [f"{name}: {ms:.3f} ms" for name, ms in self.top(n)]
+        return lines
+
+    def report(self):
+        return {
+            'window': self.window,
+            'buckets_ms': list(BUCKETS_MS),
+            'phases': {name: phase.stats() for name, phase in self.phases.items()}
+        }
+
+    def dump(self, path=None):
+        """Write the current statistics as JSON; returns the path written."""
+        path = path or time.strftime('profile-%Y%m%d-%H%M%S.json')
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
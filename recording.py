@@ -0,0 +1,225 @@
+"""Compact binary recording and playback of player input.
+
+A recording is a header followed by a stream of input events:
+
+    header:  magic, version, seed, run, level, then every UPPERCASE tuning
+             constant of the GameState as (name, float64) pairs
+    event:   varint tick delta, one byte event kind, one byte key
+
+Together with the seed that is everything needed to re-simulate a session
+tick for tick. Typical sessions take two or three bytes per key event.
+"""
+import queue
+import struct
+import threading
+
+from simulation import GameState
+
+MAGIC = b'RLGL'
+VERSION = 1
+
+KEY_DOWN, KEY_UP, SPECIAL_KEY = 0, 1, 2
+
+# GLUT special key codes, mirrored so the simulation side never imports GLUT
+KEY_LEFT, KEY_UP_ARROW, KEY_RIGHT, KEY_DOWN_ARROW = 100, 101, 102, 103
+
+_HEADER = struct.Struct('<4sHQIH')
+_CONSTANT = struct.Struct('<d')
+
+def apply_input(sim, kind, key):
+    """Apply one keyboard event the way the GLUT callbacks do."""
+    game = sim.game
+    if kind == KEY_DOWN:
+        if key == b'v':
+            game.first_person = not game.first_person
+        elif key == b'r' and game.game_over:
+            sim.restart()
+        elif key in game.keys_pressed:
+            game.keys_pressed[key] = True
+    elif kind == KEY_UP:
+        if key in game.keys_pressed:
+            game.keys_pressed[key] = False
+    elif kind == SPECIAL_KEY:
+        if key == KEY_LEFT:
+            game.cam_angle -= 5
+        elif key == KEY_RIGHT:
+            game.cam_angle += 5
+        elif key == KEY_UP_ARROW:
+            game.cam_height += 20
+        elif key == KEY_DOWN_ARROW:
+            game.cam_height = max(100, game.cam_height - 20)
+        game.cam_angle %= 360
+
+def tuning_constants(game):
+    constants = {}
+    for name, value in vars(game).items():
+        if not name.isupper():
+            continue
+        if isinstance(value, (bool, int, float)):
+            constants[name] = float(value)
+        elif isinstance(value, tuple) and all(isinstance(v, (int, float)) for v in value):
+            for i, v in enumerate(value):
+                constants[f'{name}.{i}'] = float(v)
+    return constants
+
+def apply_constants(game, constants):
+    tuples = {}
+    for name, value in constants.items():
+        if '.' in name:
+            base, index = name.rsplit('.', 1)
+            tuples.setdefault(base, {})[int(index)] = value
+            continue
+        current = getattr(game, name, None)
+        if isinstance(current, bool):
+            value = bool(value)
+        elif isinstance(current, int) and value.is_integer():
+            value = int(value)
+        setattr(game, name, value)
+    for base, items in tuples.items():
+        current = getattr(game, base, ())
+        values = [items[i] for i in range(len(items))]
+        setattr(game, base, tuple(
+            int(v) if i < len(current) and isinstance(current[i], int) and v.is_integer() else v
+            for i, v in enumerate(values)
+        ))
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return out
+
+def _encode_key(key):
+    return key[0] if isinstance(key, bytes) else key
+
+def encode_header(game):
+    constants = tuning_constants(game)
+    out = bytearray(_HEADER.pack(MAGIC, VERSION, game.seed & (2**64 - 1), game.run, game.current_level))
+    out += struct.pack('<H', len(constants))
+    for name, value in constants.items():
+        encoded = name.encode('ascii')
+        out.append(len(encoded))
+        out += encoded
+        out += _CONSTANT.pack(value)
+    return bytes(out)
+
+class InputRecorder:
+    """Buffers events in memory and hands full chunks to a writer thread."""
+
+    def __init__(self, path, game, chunk_size=4096):
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.last_tick = 0
+        self.file = open(path, 'wb')
+        self.file.write(encode_header(game))
+        self.chunks = queue.Queue()
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def _write(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            self.file.write(chunk)
+            self.file.flush()
+
+    def record(self, tick, kind, key):
+        self.buffer += _varint(tick - self.last_tick)
+        self.buffer.append(kind)
+        self.buffer.append(_encode_key(key))
+        self.last_tick = tick
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.chunks.put(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def close(self):
+        self.flush()
+        self.chunks.put(None)
+        self.writer.join()
+        self.file.close()
+
+class Recording:
+    """A decoded recording: seed, starting point, tuning and the event list."""
+
+    def __init__(self, seed, run, level, constants, events):
+        self.seed = seed
+        self.run = run
+        self.level = level
+        self.constants = constants
+        self.events = events
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.decode(f.read())
+
+    @classmethod
+    def decode(cls, data):
+        magic, version, seed, run, level = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("not an input recording")
+        if version != VERSION:
+            raise ValueError(f"unsupported recording version {version}")
+        offset = _HEADER.size
+        count, = struct.unpack_from('<H', data, offset)
+        offset += 2
+        constants = {}
+        for _ in range(count):
+            length = data[offset]
+            name = data[offset + 1:offset + 1 + length].decode('ascii')
+            offset += 1 + length
+            constants[name], = _CONSTANT.unpack_from(data, offset)
+            offset += _CONSTANT.size
+        events = []
+        tick = 0
+        while offset < len(data):
+            delta = shift = 0
+            byte = 0x80
+            while byte & 0x80 and offset < len(data):
+                byte = data[offset]
+                offset += 1
+                delta |= (byte & 0x7F) << shift
+                shift += 7
+            if byte & 0x80 or offset + 2 > len(data):
+                break  # Truncated tail from an unclean shutdown
+            tick += delta
+            kind, key = data[offset], data[offset + 1]
+            offset += 2
+            events.append((tick, kind, bytes([key]) if kind != SPECIAL_KEY else key))
+        return cls(seed, run, level, constants, events)
+
+    def make_game(self, clock=None):
+        game = GameState(seed=self.seed, clock=clock)
+        apply_constants(game, self.constants)
+        game.run = self.run
+        game.current_level = self.level
+        game.reset_level()
+        return game
+
+class InputPlayer:
+    """Feeds a recording's events back into a Simulation at their ticks."""
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.position = 0
+
+    def __call__(self, sim):
+        events = self.recording.events
+        while self.position < len(events) and events[self.position][0] <= sim.tick:
+            _, kind, key = events[self.position]
+            apply_input(sim, kind, key)
+            self.position += 1
+
+    @property
+    def finished(self):
+        return self.position >= len(self.recording.events)
@@ -0,0 +1,179 @@
+"""Seekable playback of input recordings.
+
+The player re-simulates a recording tick by tick and keeps a keyframe, a
+copy of everything a tick can change, every `interval` ticks. Seeking
+restores the closest keyframe at or before the target and simulates only
+the ticks in between. When the keyframe budget is full, every other
+keyframe is dropped and the interval doubles, so memory stays bounded
+however long the recording is.
+"""
+import bisect
+import copy
+import random
+import time
+
+import numpy as np
+
+from recording import KEY_DOWN, KEY_LEFT, KEY_RIGHT, SPECIAL_KEY, InputPlayer
+from simulation import Simulation
+
+SEEK_SECONDS = 5
+MIN_SPEED, MAX_SPEED = 0.125, 16
+
+# Copied by hand in Keyframe. The world lists and grid are rebuilt by
+# reset_level rather than modified, so keyframes share them.
+_SHARED = {'obstacles', 'trees', 'obstacle_grid', 'clock', 'rng', 'np_rng', 'npcs', 'bullets'}
+
+def _clone(obj):
+    """Shallow copy of an object with its arrays, lists and dicts copied too."""
+    clone = copy.copy(obj)
+    for name, value in vars(clone).items():
+        if isinstance(value, np.ndarray):
+            setattr(clone, name, value.copy())
+        elif isinstance(value, (list, dict)):
+            setattr(clone, name, value.copy())
+    return clone
+
+class Keyframe:
+    """Full simulation state at the start of one tick."""
+
+    def __init__(self, sim, input_position):
+        game = sim.game
+        self.tick = sim.tick
+        self.input_position = input_position
+        self.attrs = {}
+        for name, value in vars(game).items():
+            if name in _SHARED:
+                continue
+            self.attrs[name] = value.copy() if isinstance(value, (list, dict)) else value
+        self.world = (game.obstacles, game.trees, game.obstacle_grid)
+        self.clock = dict(vars(game.clock))
+        self.rng = game.rng.getstate()
+        self.np_rng = game.np_rng.bit_generator.state
+        self.npcs = _clone(game.npcs)
+        self.bullets = _clone(game.bullets)
+
+    def restore(self, sim):
+        """Put the state back into the simulation's existing GameState, in place."""
+        game = sim.game
+        for name, value in self.attrs.items():
+            setattr(game, name, value.copy() if isinstance(value, (list, dict)) else value)
+        game.obstacles, game.trees, game.obstacle_grid = self.world
+        vars(game.clock).update(self.clock)
+        game.rng = random.Random()
+        game.rng.setstate(self.rng)
+        game.np_rng = np.random.default_rng()
+        game.np_rng.bit_generator.state = self.np_rng
+        game.npcs = _clone(self.npcs)
+        game.bullets = _clone(self.bullets)
+        sim.tick = self.tick
+
+class ReplayPlayer:
+    """Plays a Recording with pause, single-step, speed control and seeking."""
+
+    def __init__(self, recording, interval=300, max_keyframes=64, clock=time.perf_counter, profiler=None):
+        self.recording = recording
+        self.game = recording.make_game()
+        self.input = InputPlayer(recording)
+        self.sim = Simulation(self.game, self.input, profiler)
+        self.event_ticks = [event[0] for event in recording.events]
+        self.interval = interval
+        self.max_keyframes = max_keyframes
+        self.keyframes = []
+        self.paused = False
+        self.speed = 1.0
+        self.clock = clock
+        self.accumulator = 0.0
+        self.last_time = None
+        self._keep()
+
+    @property
+    def tick(self):
+        return self.sim.tick
+
+    @property
+    def end_tick(self):
+        """Tick of the last recorded event; the session ran at least this long."""
+        return self.event_ticks[-1] if self.event_ticks else 0
+
+    def _keep(self):
+        ticks = [k.tick for k in self.keyframes]
+        i = bisect.bisect_left(ticks, self.sim.tick)
+        if i < len(ticks) and ticks[i] == self.sim.tick:
+            return
+        self.keyframes.insert(i, Keyframe(self.sim, self.input.position))
+        if len(self.keyframes) > self.max_keyframes:
+            self.interval *= 2
+            self.keyframes = [k for k in self.keyframes if k.tick % self.interval == 0]
+
+    def step(self, ticks=1):
+        for _ in range(ticks):
+            self.sim.step()
+            if self.sim.tick % self.interval == 0:
+                self._keep()
+        return self.sim.tick
+
+    def seek(self, tick):
+        """Jump to the start of the given tick, simulating forward from the closest keyframe."""
+        tick = max(0, tick)
+        current = self.sim.tick
+        i = bisect.bisect_right([k.tick for k in self.keyframes], tick) - 1
+        keyframe = self.keyframes[i]
+        # Carrying on from here is cheaper than restoring when the target is just ahead
+        if not keyframe.tick <= current <= tick:
+            keyframe.restore(self.sim)
+            self.input.position = keyframe.input_position
+        self.step(tick - self.sim.tick)
+        self.accumulator = 0.0
+        return self.sim.tick
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self.last_time = None
+
+    def toggle_pause(self):
+        if self.paused:
+            self.resume()
+        else:
+            self.pause()
+
+    def status(self):
+        seconds = self.tick / self.game.TICK_RATE
+        state = "paused" if self.paused else f"x{self.speed:g}"
+        return f"Replay {seconds:.1f}s (tick {self.tick}) {state}"
+
+    def update(self):
+        """Run the ticks due since the last call at the current speed; returns the number run."""
+        now = self.clock()
+        elapsed = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+        if self.paused:
+            return 0
+        dt = 1.0 / self.game.TICK_RATE
+        self.accumulator += min(elapsed, 0.25) * self.speed
+        ticks = int(self.accumulator / dt)
+        self.accumulator -= ticks * dt
+        self.step(ticks)
+        return ticks
+
+def handle_control(player, kind, key):
+    """Keyboard controls while watching a replay: P, '.', '[', ']' and left/right to seek."""
+    if kind == KEY_DOWN:
+        if key == b'p':
+            player.toggle_pause()
+        elif key == b'.':
+            player.pause()
+            player.step()
+        elif key == b'[':
+            player.speed = max(MIN_SPEED, player.speed / 2)
+        elif key == b']':
+            player.speed = min(MAX_SPEED, player.speed * 2)
+    elif kind == SPECIAL_KEY:
+        jump = SEEK_SECONDS * player.game.TICK_RATE
+        if key == KEY_LEFT:
+            player.seek(player.tick - jump)
+        elif key == KEY_RIGHT:
+            player.seek(player.tick + jump)
@@ -0,0 +1,201 @@
+"""Headless multiplayer room: one level, one spotter, many players.
+
+The room wraps a GameState for the level, spotter and NPCs, and keeps its
+players in struct-of-arrays form, so moving, detecting, shooting at and
+catching every player is a handful of NumPy passes per tick however many
+have joined. Unlike the single-player game, the spotter only fires at a
+player with no spotter bullet already on its way to them; the first one
+decides anyway, and a room full of players seen on red would otherwise
+put tens of thousands of bullets in the air. A round ends once nobody is
+still running; after the banner delay the room moves on to the next
+level if anyone finished, and starts a new run from level 1 otherwise.
+"""
+import numpy as np
+
+from bullets import OBSTACLE, SPOTTER, BulletPool
+from profiler import Profiler
+from simulation import GameState, update_npcs, update_spotter
+from vision import cone_cosine, player_detection_angle, seen
+
+# Column order of Players.keys, as in GameState.keys_pressed
+KEYS = (b'w', b's', b'a', b'd', b' ')
+RUNNING, CAUGHT, FINISHED = 0, 1, 2
+
+def keys_to_mask(keys_pressed):
+    return sum(1 << i for i, key in enumerate(KEYS) if keys_pressed.get(key))
+
+def mask_to_keys(mask):
+    return {key: bool(mask >> i & 1) for i, key in enumerate(KEYS)}
+
+class Players:
+    """One array per player attribute, indexed by slot; slots are reused after a player leaves."""
+
+    def __init__(self, capacity=16):
+        self.pos = np.zeros((capacity, 3))
+        self.angle = np.zeros(capacity)
+        self.keys = np.zeros((capacity, len(KEYS)), dtype=bool)
+        self.connected = np.zeros(capacity, dtype=bool)
+        self.status = np.zeros(capacity, dtype=np.uint8)
+        self.caught_by = np.full(capacity, -1, dtype=np.int8)
+
+    def __len__(self):
+        return int(self.connected.sum())
+
+    @property
+    def capacity(self):
+        return len(self.connected)
+
+    @property
+    def running(self):
+        return self.connected & (self.status == RUNNING)
+
+    def _grow(self):
+        for name, value in vars(self).items():
+            extra = np.zeros_like(value)
+            if name == 'caught_by':
+                extra[:] = -1
+            setattr(self, name, np.concatenate((value, extra)))
+
+    def add(self):
+        free = np.flatnonzero(~self.connected)
+        if not free.size:
+            free = [self.capacity]
+            self._grow()
+        slot = int(free[0])
+        self.connected[slot] = True
+        self.reset(slot)
+        return slot
+
+    def remove(self, slot):
+        self.connected[slot] = False
+        self.keys[slot] = False
+
+    def reset(self, slots=slice(None)):
+        self.pos[slots] = 0
+        self.angle[slots] = 0
+        self.status[slots] = RUNNING
+        self.caught_by[slots] = -1
+
+class Room:
+    """Runs the level for every player in it, one tick per step()."""
+
+    def __init__(self, seed=None, clock=None, max_players=128, profiler=None):
+        self.game = GameState(seed=seed, clock=clock)
+        self.game.show_level_start = False
+        self.players = Players()
+        self.bullets = BulletPool()
+        self.max_players = max_players
+        self.profiler = profiler or Profiler()
+        self.tick = 0
+        self.round_over_time = None
+
+    def __len__(self):
+        return len(self.players)
+
+    @property
+    def full(self):
+        return len(self.players) >= self.max_players
+
+    def join(self):
+        """Add a player at the start line; returns their slot.
+
+        Joining during the round-over banner waits for the next round,
+        which puts everyone back at the start.
+        """
+        return self.players.add()
+
+    def leave(self, slot):
+        self.players.remove(slot)
+
+    def set_keys(self, slot, mask):
+        self.players.keys[slot] = [bool(mask >> i & 1) for i in range(len(KEYS))]
+
+    def step(self):
+        with self.profiler.section('room.tick'):
+            self._step()
+
+    def _step(self):
+        game = self.game
+        players = self.players
+        now = game.clock.now()
+        if self.round_over_time is not None:
+            if now - self.round_over_time >= game.level_up_display_duration:
+                self._next_round()
+        else:
+            update_spotter(game, now)
+            self._move(now)
+            self._shoot()
+            update_npcs(game, now)
+            if players.connected.any() and not players.running.any():
+                self.round_over_time = now
+                self.bullets.clear()
+        game.clock.advance(1.0 / game.TICK_RATE)
+        self.tick += 1
+
+    def _move(self, now):
+        game = self.game
+        players = self.players
+        running = np.flatnonzero(players.running)
+        keys = players.keys[running]
+        angle = players.angle[running]
+        angle += game.TURN_SPEED * (keys[:, 2].astype(float) - keys[:, 3])
+        angle %= 360
+        players.angle[running] = angle
+        trying = keys[:, 0] | keys[:, 1]
+        moved = np.zeros(running.size, dtype=bool)
+        if game.spotter_state == "green" or not game.FREEZE_ON_RED:
+            step = game.PLAYER_SPEED * (keys[:, 1].astype(float) - keys[:, 0])
+            radians = np.radians(-angle)
+            players.pos[running, 0] += np.sin(radians) * step
+            players.pos[running, 1] += np.cos(radians) * step
+            moved = trying & (step != 0)
+        if game.spotter_state == "red":
+            # Same rules as the single-player game; update_npcs catches the NPCs
+            movers = running[trying & (moved | game.FREEZE_ON_RED)]
+            if movers.size:
+                xs, ys = players.pos[movers, 0], players.pos[movers, 1]
+                cosines = np.full(movers.size, cone_cosine(player_detection_angle(game)))
+                bullets = self.bullets
+                targeted = np.zeros(players.capacity, dtype=bool)
+                targeted[bullets.target[bullets.active & (bullets.source == SPOTTER)]] = True
+                for slot in movers[seen(game, xs, ys, cosines)]:
+                    if not targeted[slot]:
+                        bullets.spawn(game.spotter_pos[0], game.spotter_pos[1], 0, SPOTTER, slot)
+        pos = players.pos[running]
+        np.clip(pos[:, 0], -500, game.GAME_LENGTH, out=pos[:, 0])
+        np.clip(pos[:, 1], -500, 500, out=pos[:, 1])
+        players.pos[running] = pos
+        players.status[running[pos[:, 0] >= game.GAME_LENGTH]] = FINISHED
+        # Obstacles someone runs into fire at them, as check_obstacles does
+        near = running[game.obstacle_grid.any_within(pos[:, 0], pos[:, 1], game.OBSTACLE_RADIUS)]
+        for slot in near:
+            for i in game.obstacle_grid.query(players.pos[slot, 0], players.pos[slot, 1], game.OBSTACLE_RADIUS):
+                obstacle = game.obstacles[i]
+                self.bullets.spawn(obstacle[0], obstacle[1], 0, OBSTACLE, slot)
+
+    def _shoot(self):
+        game = self.game
+        players = self.players
+        targets, sources = self.bullets.update_targets(
+            players.pos[:, 0], players.pos[:, 1], players.running, game.BULLET_SPEED, game.BULLET_HEIGHT)
+        if targets.size:
+            # The first bullet to reach a player is the one that caught them
+            targets, first = np.unique(targets, return_index=True)
+            caught = players.status[targets] == RUNNING
+            players.status[targets[caught]] = CAUGHT
+            players.caught_by[targets[caught]] = sources[first][caught]
+
+    def _next_round(self):
+        game = self.game
+        players = self.players
+        finished = players.connected & (players.status == FINISHED)
+        if finished.any() and game.current_level < game.max_level:
+            game.current_level += 1
+        else:
+            game.run += 1
+            game.current_level = 1
+        game.reset_level()
+        game.show_level_start = False
+        players.reset()
+        self.bullets.clear()
+        self.round_over_time = None
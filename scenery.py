@@ -0,0 +1,253 @@
+"""Static scenery baked into one vertex buffer per level, chunked into cells for culling."""
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+import meshes
+from lod import LodSettings
+
+TRUNK = meshes.colored(meshes.cube(10) * (1, 1, 5) + (0, 0, 25), (0.5, 0.3, 0.1))
+CANOPY = meshes.colored(meshes.sphere(25, 20, 20) + (0, 0, 70), (0.1, 0.6, 0.1))
+TREE = np.concatenate((TRUNK, CANOPY))
+TREE_REDUCED = np.concatenate((TRUNK, meshes.colored(meshes.sphere(25, 8, 8) + (0, 0, 70), (0.1, 0.6, 0.1))))
+
+def _tree_impostor():
+    """Two crossed flat silhouettes that stand in for a far-away tree."""
+    parts = []
+    for axis in ('x', 'y'):
+        u = (1, 0, 0) if axis == 'y' else (0, 1, 0)
+        corners = [np.multiply(u, side) + (0, 0, z) for side, z in ((-5, 0), (5, 0), (5, 50), (-5, 50))]
+        parts.append(meshes.colored(meshes.quad(*corners), (0.5, 0.3, 0.1)))
+        parts.append(meshes.colored(meshes.disc(25, 8, (0, 0, 70), axis), (0.1, 0.6, 0.1)))
+    return np.concatenate(parts)
+
+TREE_IMPOSTOR = _tree_impostor()
+OBSTACLE = meshes.colored(meshes.cube(40), (0.5, 0.2, 0.1))
+
+TREE_BOUNDS = ((0, 0, 50), 50)
+OBSTACLE_BOUNDS = ((0, 0, 0), 35)
+CELL_SIZE = 400
+# Bytes of a pre-built level's geometry uploaded per frame ahead of the switch
+UPLOAD_CHUNK = 1 << 20
+TREE_LODS = (TREE, TREE_REDUCED, TREE_IMPOSTOR)
+
+def _cell_groups(positions, lod_meshes, bounds):
+    """Split tiled copies of a mesh into per-cell vertex blocks with bounding spheres.
+
+    One block is built per entry of lod_meshes, from full detail down.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    if not len(positions):
+        return []
+    offset, radius = bounds
+    keys = np.floor(positions / CELL_SIZE).astype(int)
+    groups = []
+    for key in np.unique(keys, axis=0):
+        members = positions[(keys == key).all(axis=1)]
+        centers = np.zeros((len(members), 3))
+        centers[:, :2] = members
+        centers += offset
+        low = centers.min(axis=0) - radius
+        high = centers.max(axis=0) + radius
+        offsets = np.column_stack((members, np.zeros(len(members))))
+        groups.append(([meshes.tile(mesh, offsets) for mesh in lod_meshes],
+                       (low + high) / 2, np.linalg.norm(high - low) / 2, len(members)))
+    return groups
+
+def build_scenery(game):
+    """Static geometry as interleaved xyz/rgb triangles grouped into grid cells.
+
+    Returns the vertex array and, per cell, its first vertex and vertex
+    count at each tree detail level, its bounding sphere, the number of
+    scenery objects it holds and whether it has trees to switch LOD on.
+    """
+    length = game.GAME_LENGTH
+    ground = meshes.colored(meshes.quad(
+        (-500, -500, 0), (length + 500, -500, 0), (length + 500, 500, 0), (-500, 500, 0)
+    ), (0.2, 0.8, 0.2))
+    finish = meshes.colored(meshes.quad(
+        (length, -500, 0), (length, 500, 0), (length, 500, 100), (length, -500, 100)
+    ), (1, 1, 1))
+    groups = [
+        ([ground], (length / 2, 0, 0), np.hypot(length / 2 + 500, 500), 1),
+        ([finish], (length, 0, 50), np.hypot(500, 50), 1)
+    ]
+    groups += _cell_groups(game.trees, TREE_LODS, TREE_BOUNDS)
+    groups += _cell_groups(game.obstacles, (OBSTACLE,), OBSTACLE_BOUNDS)
+    return _pack(groups)
+
+def build_chunk(world, chunk):
+    """Geometry of one chunk of a streamed level: its stretch of ground, the finish if it falls there, its trees and obstacles."""
+    length = world.length
+    start = chunk.index * world.chunk_length
+    end = start + world.chunk_length
+    groups = []
+    low, high = max(start, -500), min(end, length + 500)
+    if low < high:
+        ground = meshes.colored(meshes.quad(
+            (low, -500, 0), (high, -500, 0), (high, 500, 0), (low, 500, 0)
+        ), (0.2, 0.8, 0.2))
+        groups.append(([ground], ((low + high) / 2, 0, 0), np.hypot((high - low) / 2, 500), 1))
+    if start <= length < end:
+        finish = meshes.colored(meshes.quad(
+            (length, -500, 0), (length, 500, 0), (length, 500, 100), (length, -500, 100)
+        ), (1, 1, 1))
+        groups.append(([finish], (length, 0, 50), np.hypot(500, 50), 1))
+    groups += _cell_groups(chunk.trees, TREE_LODS, TREE_BOUNDS)
+    groups += _cell_groups(chunk.obstacles, (OBSTACLE,), OBSTACLE_BOUNDS)
+    return _pack(groups)
+
+def _pack(groups):
+    """One vertex array for all groups, with per-cell ranges into it."""
+    blocks = []
+    first = np.zeros((len(groups), len(TREE_LODS)), dtype=np.int32)
+    count = np.zeros_like(first)
+    offset = 0
+    for i, group in enumerate(groups):
+        for level in range(len(TREE_LODS)):
+            if level < len(group[0]):
+                blocks.append(group[0][level])
+                first[i, level] = offset
+                count[i, level] = len(group[0][level])
+                offset += len(group[0][level])
+            else:
+                first[i, level] = first[i, level - 1]
+                count[i, level] = count[i, level - 1]
+    cells = {
+        'first': first,
+        'count': count,
+        'center': np.array([g[1] for g in groups], dtype=float).reshape(-1, 3),
+        'radius': np.array([g[2] for g in groups], dtype=float),
+        'objects': np.array([g[3] for g in groups]),
+        'lod': np.array([len(g[0]) > 1 for g in groups], dtype=bool)
+    }
+    return np.concatenate(blocks) if blocks else np.zeros((0, 6), dtype=np.float32), cells
+
+class SceneryCache:
+    """Uploads the level's static geometry once and draws the visible cells of it.
+
+    A streamed level gets one buffer per resident chunk instead, built when
+    the chunk arrives and freed when it is evicted.
+    """
+
+    STRIDE = 6 * 4
+
+    def __init__(self, lod=None):
+        self.lod = lod or LodSettings()
+        self.vbo = None
+        self.vertex_count = 0
+        self.version = None
+        self.cells = None
+        self.culled = 0
+        # A pre-built level's geometry: (level, vertices, cells, bytes uploaded so far)
+        self.next = None
+        self.next_vbo = None
+        # Streamed level being drawn and its chunks' (vbo, cells) by chunk index
+        self.world = None
+        self.chunks = {}
+
+    def prepare(self, level):
+        """Build a Level's geometry ahead of time; safe to call from a worker thread."""
+        if level.world is not None:
+            return
+        vertices, cells = build_scenery(level)
+        self.next = [level, vertices, cells, 0]
+
+    def _upload_next(self):
+        """Copy the next chunk of pre-built geometry into the spare buffer."""
+        level, vertices, cells, done = self.next
+        if done >= vertices.nbytes:
+            return
+        if self.next_vbo is None:
+            self.next_vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.next_vbo)
+        if done == 0:
+            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, None, GL_STATIC_DRAW)
+        size = min(UPLOAD_CHUNK, vertices.nbytes - done)
+        data = vertices.view(np.uint8).reshape(-1)[done:done + size]
+        glBufferSubData(GL_ARRAY_BUFFER, done, size, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.next[3] = done + size
+
+    def rebuild(self, game):
+        upcoming = self.next
+        if upcoming is not None and upcoming[0] is getattr(game, 'level_data', None):
+            # Finish the upload if the switch came before it did
+            while upcoming[3] < upcoming[1].nbytes:
+                self._upload_next()
+            self.next = None
+            level, vertices, self.cells, _ = upcoming
+            self.vbo, self.next_vbo = self.next_vbo, self.vbo
+        else:
+            if upcoming is not None:
+                # Built for a level that is not the one being played, e.g. one
+                # prepared on game over and then thrown away
+                self.next = None
+                if self.next_vbo is not None:
+                    glDeleteBuffers(1, [self.next_vbo])
+                    self.next_vbo = None
+            vertices, self.cells = build_scenery(game)
+            if self.vbo is None:
+                self.vbo = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.vertex_count = len(vertices)
+        self.version = game.world_version
+
+    def _stream(self, game):
+        """Upload the chunks that arrived and free the ones that left."""
+        if game.world is not self.world:
+            self.world = game.world
+            resident = {}
+        else:
+            resident = {chunk.index for chunk in game.chunks}
+        for index in [index for index in self.chunks if index not in resident]:
+            glDeleteBuffers(1, [self.chunks.pop(index)[0]])
+        for chunk in game.chunks or ():
+            if chunk.index not in self.chunks:
+                vertices, cells = build_chunk(game.world, chunk)
+                vbo = glGenBuffers(1)
+                glBindBuffer(GL_ARRAY_BUFFER, vbo)
+                glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+                glBindBuffer(GL_ARRAY_BUFFER, 0)
+                self.chunks[chunk.index] = (vbo, cells)
+
+    def draw(self, game, frustum=None):
+        if game.world is not None or self.chunks:
+            self._stream(game)
+        if game.world is not None:
+            self.culled = 0
+            for vbo, cells in self.chunks.values():
+                self._draw_cells(vbo, cells, frustum)
+            return
+        if self.version != game.world_version:
+            self.rebuild(game)
+        elif self.next is not None:
+            self._upload_next()
+        self.culled = 0
+        self._draw_cells(self.vbo, self.cells, frustum)
+
+    def _draw_cells(self, vbo, cells, frustum):
+        levels = np.zeros(len(cells['center']), dtype=int)
+        if frustum is None:
+            visible = np.ones(len(levels), dtype=bool)
+        else:
+            visible = frustum.test_spheres(cells['center'], cells['radius'])
+            lod = cells['lod']
+            levels[lod] = self.lod.tree_levels(frustum.distances(cells['center'][lod]))
+        self.culled += int(cells['objects'][~visible].sum())
+        if not visible.any():
+            return
+        rows = np.flatnonzero(visible)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, self.STRIDE, ctypes.c_void_p(0))
+        glColorPointer(3, GL_FLOAT, self.STRIDE, ctypes.c_void_p(12))
+        glMultiDrawArrays(GL_TRIANGLES, cells['first'][rows, levels[rows]],
+                          cells['count'][rows, levels[rows]], len(rows))
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
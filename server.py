@@ -0,0 +1,361 @@
+"""Authoritative multiplayer server over asyncio streams.
+
+The server owns every room's simulation and ticks them all at the game's
+tick rate. Clients only send their key state, in the same shape as
+GameState.keys_pressed, and get the room's state back after every tick
+as a snapshot (see snapshot.py) delta-encoded against the last one they
+acknowledged.
+
+Every message is framed as a little-endian u32 body length followed by
+the body, whose first byte is the message type:
+
+    client:  HELLO room name | KEYS u8 key mask, bit i for room.KEYS[i] |
+             ACK u32 snapshot sequence
+    server:  WELCOME slot, seed, run, level, tick rate | FULL |
+             STATE encoded snapshot
+
+A room opens with the first HELLO naming it and closes when its last
+client leaves. FULL answers a HELLO for a full room, or for a new one
+while MAX_ROOMS are open.
+
+A room's snapshot is encoded once per tick for each distinct baseline
+its clients acknowledged, usually just one or two. A client that stops
+reading has updates dropped rather than queued; its next update is then
+encoded against an older baseline, or from scratch once that has left
+the room's history. To load test with in-process clients over loopback:
+
+    python server.py --bench --clients 120 --seconds 10
+
+The bots of a room decode each message once between them, so what the
+bench measures is the server rather than the bots.
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import struct
+import sys
+import time
+
+from profiler import Profiler
+from room import KEYS, RUNNING, Room, keys_to_mask
+from simulation import GameState
+import snapshot
+
+HELLO, KEYS_MESSAGE, WELCOME, FULL, STATE, ACK = 1, 2, 3, 4, 5, 6
+
+_FRAME = struct.Struct('<I')
+_WELCOME = struct.Struct('<BHQIHH')
+_ACK = struct.Struct('<BI')
+
+# Bytes a client may have unsent before its state updates are skipped
+MAX_BUFFER = 256 * 1024
+# Rooms open at once, and bytes of a room name; HELLOs beyond either are turned away
+MAX_ROOMS = 64
+MAX_ROOM_NAME = 64
+
+def frame(body):
+    return _FRAME.pack(len(body)) + body
+
+async def read_frame(reader):
+    """The next frame's body; raises ValueError for an empty or oversized one, before reading it."""
+    header = await reader.readexactly(_FRAME.size)
+    length = _FRAME.unpack(header)[0]
+    if not 0 < length <= MAX_BUFFER:
+        raise ValueError(f"bad frame length {length}")
+    return await reader.readexactly(length)
+
+class Server:
+    def __init__(self, host='127.0.0.1', port=0, seed=None, max_players=128, profiler=None):
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.max_players = max_players
+        self.profiler = profiler or Profiler()
+        self.rooms = {}
+        # Per room, the writer of each connected slot, the sequence of the
+        # last snapshot each slot acknowledged and the snapshots sent
+        self.clients = {}
+        self.acked = {}
+        self.histories = {}
+        self.rooms_opened = 0
+        self.ticks = 0
+        self.late_ticks = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self._server = None
+        self._ticker = None
+        self._handlers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ticker = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._ticker.cancel()
+        self._server.close()
+        for clients in self.clients.values():
+            for writer in clients.values():
+                writer.close()
+        # Closing the writers ends each handler's read loop
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def _room(self, name):
+        """The room called name, opened if need be; None when no more rooms can be opened."""
+        room = self.rooms.get(name)
+        if room is None:
+            if len(self.rooms) >= MAX_ROOMS:
+                return None
+            seed = None if self.seed is None else self.seed + self.rooms_opened
+            room = self.rooms[name] = Room(seed, max_players=self.max_players, profiler=self.profiler)
+            self.clients[name] = {}
+            self.acked[name] = {}
+            self.histories[name] = snapshot.History()
+            self.rooms_opened += 1
+        return room
+
+    def _close_room(self, name):
+        """Forget a room once its last client has gone, so it stops ticking."""
+        if not self.clients[name]:
+            del self.rooms[name], self.clients[name], self.acked[name], self.histories[name]
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            body = await read_frame(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            writer.close()
+            return
+        if body[0] != HELLO or len(body) - 1 > MAX_ROOM_NAME:
+            writer.close()
+            return
+        name = body[1:].decode('utf-8', 'replace')
+        room = self._room(name)
+        if room is None or room.full:
+            writer.write(frame(bytes([FULL])))
+            writer.close()
+            if room is not None:
+                self._close_room(name)
+            return
+        slot = room.join()
+        game = room.game
+        writer.write(frame(_WELCOME.pack(WELCOME, slot, game.seed & (2**64 - 1), game.run,
+                                         game.current_level, game.TICK_RATE)))
+        self.clients[name][slot] = writer
+        try:
+            while True:
+                body = await read_frame(reader)
+                if body[0] == KEYS_MESSAGE and len(body) == 2:
+                    room.set_keys(slot, body[1])
+                elif body[0] == ACK and len(body) == _ACK.size:
+                    sequence = _ACK.unpack(body)[1]
+                    if sequence > self.acked[name].get(slot, 0):
+                        self.acked[name][slot] = sequence
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            # A malformed frame ends the connection like a dropped one
+            pass
+        finally:
+            room.leave(slot)
+            del self.clients[name][slot]
+            self.acked[name].pop(slot, None)
+            self._close_room(name)
+            writer.close()
+
+    def _broadcast(self, name, room):
+        clients = self.clients[name]
+        if not clients:
+            return
+        history = self.histories[name]
+        current = history.add(snapshot.capture(room))
+        acked = self.acked[name]
+        # Encoded bytes by baseline sequence, None for a full snapshot
+        encoded = {}
+        for slot, writer in clients.items():
+            if writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                self.dropped += 1
+                continue
+            baseline = history.get(acked.get(slot, 0))
+            key = baseline and baseline.sequence
+            data = encoded.get(key)
+            if data is None:
+                data = encoded[key] = frame(bytes([STATE]) + snapshot.encode(current, baseline))
+            writer.write(data)
+            self.bytes_sent += len(data)
+
+    def tick(self):
+        """Step every room once."""
+        for room in self.rooms.values():
+            room.step()
+        self.ticks += 1
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Rooms play by GameState's tick rate, so one game has the constants
+        game = GameState()
+        dt = 1.0 / game.TICK_RATE
+        max_ticks = game.MAX_CATCH_UP_TICKS
+        next_tick = loop.time()
+        while True:
+            with self.profiler.section('server.frame'):
+                ticks = 0
+                while loop.time() >= next_tick and ticks < max_ticks:
+                    self.tick()
+                    next_tick += dt
+                    ticks += 1
+                if loop.time() >= next_tick:
+                    # Too far behind: drop the backlog instead of spiralling
+                    self.late_ticks += round((loop.time() - next_tick) / dt) + 1
+                    next_tick = loop.time() + dt
+                with self.profiler.section('server.broadcast'):
+                    for name, room in self.rooms.items():
+                        self._broadcast(name, room)
+            await asyncio.sleep(next_tick - loop.time())
+
+class Client:
+    """A player's connection; keeps the latest snapshot the server sent, and acknowledges each one."""
+
+    def __init__(self, reader, writer, welcome, decoded=None):
+        self.reader = reader
+        self.writer = writer
+        (_, self.slot, self.seed, self.run, self.level, self.tick_rate) = _WELCOME.unpack(welcome)
+        self.keys_pressed = {key: False for key in KEYS}
+        self.state = None
+        # Snapshots received, by sequence, for decoding what the server encodes against them
+        self.received = {}
+        # Snapshots by the message they came in, shared by clients of one room in one process
+        self.decoded = decoded
+        self.frames = 0
+        self.bytes = 0
+
+    @classmethod
+    async def connect(cls, host, port, room='lobby', decoded=None):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.write(frame(bytes([HELLO]) + room.encode('utf-8')))
+        body = await read_frame(reader)
+        if body[0] == FULL:
+            writer.close()
+            raise ConnectionRefusedError(f"room {room!r} is full")
+        return cls(reader, writer, body, decoded)
+
+    def send_keys(self, keys_pressed):
+        self.keys_pressed.update(keys_pressed)
+        self.writer.write(frame(bytes([KEYS_MESSAGE, keys_to_mask(self.keys_pressed)])))
+
+    async def receive(self):
+        """Wait for the next state update and return it decoded."""
+        body = await read_frame(self.reader)
+        self.frames += 1
+        self.bytes += _FRAME.size + len(body)
+        if body[0] == STATE:
+            data = body[1:]
+            state = None if self.decoded is None else self.decoded.get(data)
+            if state is None:
+                base = snapshot.baseline_of(data)
+                state = snapshot.decode(data, None if base is None else self.received[base])
+                if self.decoded is not None:
+                    self.decoded[data] = state
+                    if len(self.decoded) > snapshot.HISTORY_SIZE:
+                        del self.decoded[next(iter(self.decoded))]
+            self.state = state
+            sequence = self.state.sequence
+            self.received[sequence] = self.state
+            oldest = sequence - snapshot.HISTORY_SIZE
+            for stale in [seq for seq in self.received if seq <= oldest]:
+                del self.received[stale]
+            self.writer.write(frame(_ACK.pack(ACK, sequence)))
+        return self.state
+
+    def close(self):
+        self.writer.close()
+
+async def _bot(client, rng):
+    """Runs on green and stops on red after a short reaction time, drifting left and right."""
+    reaction = 0
+    try:
+        while True:
+            state = await client.receive()
+            if state is None:
+                continue
+            status = state.tables['players']['status']
+            if client.slot >= status.size or status[client.slot] != RUNNING + 1:
+                if client.keys_pressed[b'w']:
+                    client.send_keys({b'w': False, b'a': False, b'd': False})
+                continue
+            go = not state.red
+            if go != client.keys_pressed[b'w']:
+                reaction += 1
+                if reaction >= rng.randint(4, 15):
+                    client.send_keys({b'w': go})
+                    reaction = 0
+            elif rng.random() < 0.01:
+                turn = rng.choice((b'a', b'd', None))
+                client.send_keys({b'a': turn == b'a', b'd': turn == b'd'})
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+async def bench(clients, seconds, rooms=1, seed=0):
+    """Run a server and loopback bot clients in this process; returns the measurements."""
+    profiler = Profiler(enabled=True, window=int(seconds * 60) + 60)
+    server = Server(seed=seed, max_players=-(-clients // rooms), profiler=profiler)
+    await server.start()
+    # A room's clients get the same messages, so each is only decoded once
+    decoded = [{} for _ in range(rooms)]
+    connected = [await Client.connect(server.host, server.port, f'room{i % rooms}', decoded[i % rooms])
+                 for i in range(clients)]
+    rng = random.Random(seed)
+    tasks = [asyncio.create_task(_bot(client, random.Random(rng.random()))) for client in connected]
+    # Only count the steady state, after everyone has joined
+    profiler.phases.clear()
+    start_ticks, start_late, start_dropped, start_bytes = server.ticks, server.late_ticks, server.dropped, server.bytes_sent
+    start_frames = sum(client.frames for client in connected)
+    start = time.perf_counter()
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - start
+    report = {
+        'clients': clients,
+        'rooms': rooms,
+        'seconds': elapsed,
+        'tick_rate': (server.ticks - start_ticks) / elapsed,
+        'late_ticks': server.late_ticks - start_late,
+        'dropped_updates': server.dropped - start_dropped,
+        'updates_per_client_per_second': (sum(c.frames for c in connected) - start_frames) / clients / elapsed,
+        'sent_bytes_per_second': (server.bytes_sent - start_bytes) / elapsed,
+        'phases': {name: phase.stats() for name, phase in profiler.phases.items()}
+    }
+    for client in connected:
+        client.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await server.close()
+    return report
+
+async def serve(host, port, seed):
+    server = Server(host, port, seed)
+    await server.start()
+    print(f"Listening on {host}:{server.port}", file=sys.stderr)
+    await asyncio.Event().wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--bench', action='store_true', help="load test with in-process loopback clients")
+    parser.add_argument('--clients', type=int, default=120)
+    parser.add_argument('--rooms', type=int, default=1)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args(argv)
+    if args.bench:
+        report = asyncio.run(bench(args.clients, args.seconds, args.rooms, args.seed or 0))
+        print(json.dumps(report, indent=2))
+    else:
+        asyncio.run(serve(args.host, args.port, args.seed))
+
+if __name__ == "__main__":
+    main()
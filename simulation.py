@@ -0,0 +1,338 @@
+"""Headless game state and tick logic for Red Light, Green Light.
+
+Nothing in here touches OpenGL or GLUT, so the simulation can be stepped
+as fast as the CPU allows for tests, bots and balancing runs.
+"""
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bullets import OBSTACLE, BulletPool
+from clock import VirtualClock
+from crowd import Crowd, update_crowd
+from occlusion import SightMap
+from profiler import Profiler
+from spatial import SpatialGrid
+from vision import detect_npcs, detect_player, player_trying_to_move
+from world import StreamedWorld
+
+# Per-level values reset_level derives from the tuning constants
+DERIVED = ('GAME_LENGTH', 'OBSTACLE_COUNT', 'PLAYER_SPEED', 'TURN_SPEED', 'SPOTTER_TURN_SPEED', 'BULLET_SPEED')
+# Constants a frontend sets for how it plays, which generating a level never reads
+RULES = ('WINDOW_WIDTH', 'WINDOW_HEIGHT', 'TICK_RATE', 'MAX_CATCH_UP_TICKS', 'FREEZE_ON_RED', 'BULLET_HEIGHT',
+         'LINE_OF_SIGHT')
+
+def _tuning(game):
+    return {name: value for name, value in vars(game).items()
+            if name.isupper() and name not in DERIVED and name not in RULES}
+
+class Level:
+    """The generated world of one level, built apart from the live game.
+
+    Only reads the game's seed and tuning constants, so it can be built on
+    another thread while the current level is still being played.
+    """
+
+    FIELDS = DERIVED + ('level_seed', 'rng', 'np_rng', 'spotter_pos', 'obstacles', 'obstacle_grid',
+                        'trees', 'npcs', 'sight', 'world', 'chunks', 'chunk_window')
+
+    def __init__(self, game, number, run):
+        self.tuning = _tuning(game)
+        vars(self).update(self.tuning)
+        self.seed = game.seed
+        self.run = run
+        self.current_level = number
+        self.used = False
+        self.level_seed = int(np.random.SeedSequence([self.seed, run, number]).generate_state(1)[0])
+        self.rng = random.Random(self.level_seed)
+        self.np_rng = np.random.default_rng(self.level_seed)
+        steps = number - 1
+        self.GAME_LENGTH = int(self.BASE_GAME_LENGTH * (1 + self.LENGTH_GROWTH * steps))
+        self.OBSTACLE_COUNT = self.BASE_OBSTACLE_COUNT + steps * self.OBSTACLES_PER_LEVEL
+        self.PLAYER_SPEED = self.BASE_PLAYER_SPEED * (1 + self.PLAYER_SPEED_GROWTH * steps)
+        self.TURN_SPEED = self.BASE_TURN_SPEED
+        self.SPOTTER_TURN_SPEED = self.BASE_SPOTTER_TURN_SPEED * (1 + self.SPOTTER_TURN_GROWTH * steps)
+        self.BULLET_SPEED = self.BASE_BULLET_SPEED * (1 + self.BULLET_SPEED_GROWTH * steps)
+        self.spotter_pos = [self.GAME_LENGTH + 200, 0, 0]
+        if self.GAME_LENGTH > self.STREAM_LENGTH:
+            self.world = StreamedWorld(self)
+            self.chunk_window = self.world.window(0)
+            (self.chunks, self.obstacles, self.trees, self.obstacle_grid,
+             self.sight) = self.world.assemble(self.chunk_window)
+            self.generate_npcs()
+        else:
+            self.world = self.chunks = self.chunk_window = None
+            self.generate_obstacles()
+            self.generate_trees()
+            self.generate_npcs()
+            self.sight = SightMap.for_game(self)
+
+    def matches(self, game):
+        """Whether this is the level the game would generate next."""
+        return (not self.used and self.seed == game.seed and self.run == game.run
+                and self.current_level == game.current_level and self.tuning == _tuning(game))
+
+    def generate_obstacles(self):
+        self.obstacles = []
+        for _ in range(self.OBSTACLE_COUNT):
+            x = self.rng.randint(100, self.GAME_LENGTH - 100)
+            y = self.rng.randint(-400, 400)
+            self.obstacles.append([x, y])
+        self.obstacle_grid = SpatialGrid(self.obstacles, self.OBSTACLE_RADIUS)
+
+    def generate_trees(self):
+        self.trees = []
+        for x in range(-400, self.GAME_LENGTH + 400, 100):
+            if self.rng.random() > 0.3:
+                self.trees.append([x, -450 + self.rng.randint(-20, 20)])
+            if self.rng.random() > 0.3:
+                self.trees.append([x, 450 + self.rng.randint(-20, 20)])
+        for _ in range(30):
+            x = self.spotter_pos[0] + self.rng.randint(50, 300)
+            y = self.rng.randint(-500, 500)
+            self.trees.append([x, y])
+        for _ in range(15):
+            x = self.rng.randint(100, self.GAME_LENGTH - 100)
+            y = self.rng.randint(-400, 400)
+            self.trees.append([x, y])
+
+    def generate_npcs(self):
+        self.npcs = Crowd(self.NPC_COUNT, self.PLAYER_SPEED, self.np_rng, self.NPC_POLICY_MIX)
+
+class GameState:
+    def __init__(self, seed=None, clock=None):
+        # Each run and level reseeds its own generators from this, see reset_level
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.run = 0
+        self.clock = clock or VirtualClock()
+        self.WINDOW_WIDTH, self.WINDOW_HEIGHT = 1080, 600
+        self.BASE_GAME_LENGTH = 1000
+        self.BASE_PLAYER_SPEED = 5
+        self.BASE_TURN_SPEED = 5
+        self.BASE_SPOTTER_TURN_SPEED = 2
+        self.SPOTTER_HEAD_ANGLE_RANGE = (-90, 90)
+        self.BASE_BULLET_SPEED = 15
+        self.BASE_OBSTACLE_COUNT = 10
+        # Difficulty curve, applied per level above the first by reset_level
+        self.LENGTH_GROWTH = 0.15
+        self.OBSTACLES_PER_LEVEL = 5
+        self.PLAYER_SPEED_GROWTH = 0.05
+        self.SPOTTER_TURN_GROWTH = 0.1
+        self.BULLET_SPEED_GROWTH = 0.1
+        self.NPC_COUNT = 4
+        # Share of NPCs driven by each of policies.POLICIES
+        self.NPC_POLICY_MIX = (1, 0, 0, 0)
+        self.OBSTACLE_RADIUS = 30
+        self.TICK_RATE = 60
+        self.MAX_CATCH_UP_TICKS = 5
+        self.FREEZE_ON_RED = True
+        self.BULLET_HEIGHT = 0
+        self.LINE_OF_SIGHT = True
+        # Levels longer than this are streamed in chunks, see world.py
+        self.STREAM_LENGTH = 20000
+        self.CHUNK_LENGTH = 1000
+        self.CHUNKS_AHEAD = 3
+        self.CHUNKS_BEHIND = 1
+        self.current_level = 1
+        self.max_level = 5
+        self.level_complete = False
+        self.level_up_time = 0
+        self.level_up_display_duration = 1
+        self.show_level_start = True
+        self.level_start_time = 0
+        self.total_time = 0
+        self.world_version = 0
+        self.reset_level()
+        self.cam_angle, self.cam_radius, self.cam_height = 45, 500, 500
+        self.first_person = False
+        self.keys_pressed = {
+            b'w': False,
+            b's': False,
+            b'a': False,
+            b'd': False,
+            b' ': False
+        }
+
+    def reset_level(self, level=None):
+        """Start the current level, from a pre-built Level if it is the right one."""
+        if level is None or not level.matches(self):
+            level = Level(self, self.current_level, self.run)
+        level.used = True
+        for name in Level.FIELDS:
+            setattr(self, name, getattr(level, name))
+        self.level_data = level
+        self.player_pos = [0, 0, 0]
+        self.player_angle = 0
+        self.spotter_head_angle = 0
+        self.spotter_state = "green"
+        self.last_state_change = -math.inf
+        self.state_duration = 0
+        self.game_over = False
+        self.game_won = False
+        self.player_caught = False
+        self.caught_by = None
+        self.start_time = self.clock.now()
+        self.finish_time = 0
+        self.bullets = BulletPool()
+        self.level_complete = False
+        self.show_level_start = True
+        self.level_start_time = self.clock.now()
+        self.world_version += 1
+
+def update_spotter(game, now):
+    if now - game.last_state_change > game.state_duration:
+        game.spotter_state = "green" if game.spotter_state == "red" else "red"
+        game.last_state_change = now
+        game.state_duration = game.rng.uniform(1.0, 3.0)
+    if game.spotter_state == "red":
+        game.spotter_head_angle += game.SPOTTER_TURN_SPEED
+        if game.spotter_head_angle > game.SPOTTER_HEAD_ANGLE_RANGE[1]:
+            game.spotter_head_angle = game.SPOTTER_HEAD_ANGLE_RANGE[1]
+            game.SPOTTER_TURN_SPEED *= -1
+        elif game.spotter_head_angle < game.SPOTTER_HEAD_ANGLE_RANGE[0]:
+            game.spotter_head_angle = game.SPOTTER_HEAD_ANGLE_RANGE[0]
+            game.SPOTTER_TURN_SPEED *= -1
+    else:
+        if abs(game.spotter_head_angle) > 1:
+            game.spotter_head_angle *= 0.8
+
+def update_bullets(game):
+    if game.bullets.update(game.player_pos[0], game.player_pos[1], game.BULLET_SPEED, game.BULLET_HEIGHT):
+        game.game_over = True
+        game.player_caught = True
+        game.caught_by = "obstacle" if game.bullets.hit_source == OBSTACLE else "spotter"
+
+def check_obstacles(game):
+    for i in game.obstacle_grid.query(game.player_pos[0], game.player_pos[1], game.OBSTACLE_RADIUS):
+        obstacle = game.obstacles[i]
+        game.bullets.spawn(obstacle[0], obstacle[1], 0, OBSTACLE)
+
+def update_npcs(game, now):
+    update_crowd(game, now)
+    if game.spotter_state == "red":
+        # After the crowd's step, as some policies move on red too
+        detect_npcs(game, now)
+
+def update_player_movement(game, now):
+    if game.game_over or game.level_complete:
+        return
+    if game.keys_pressed[b'a']:
+        game.player_angle += game.TURN_SPEED
+    if game.keys_pressed[b'd']:
+        game.player_angle -= game.TURN_SPEED
+    game.player_angle %= 360
+    player_moved = False
+    if game.spotter_state == "green" or not game.FREEZE_ON_RED:
+        prev_x, prev_y = game.player_pos[0], game.player_pos[1]
+        move_x = math.sin(math.radians(-game.player_angle))
+        move_y = math.cos(math.radians(-game.player_angle))
+        if game.keys_pressed[b's']:
+            game.player_pos[0] += move_x * game.PLAYER_SPEED
+            game.player_pos[1] += move_y * game.PLAYER_SPEED
+        if game.keys_pressed[b'w']:
+            game.player_pos[0] -= move_x * game.PLAYER_SPEED
+            game.player_pos[1] -= move_y * game.PLAYER_SPEED
+        player_moved = prev_x != game.player_pos[0] or prev_y != game.player_pos[1]
+    if game.spotter_state == "red" and (game.FREEZE_ON_RED or player_moved) and player_trying_to_move(game):
+        # Checked before being clamped to the field
+        detect_player(game)
+    game.player_pos[0] = max(-500, min(game.GAME_LENGTH, game.player_pos[0]))
+    game.player_pos[1] = max(-500, min(500, game.player_pos[1]))
+    if game.player_pos[0] >= game.GAME_LENGTH:
+        if game.current_level < game.max_level:
+            game.level_complete = True
+            game.level_up_time = now
+            game.total_time += now - game.start_time
+        else:
+            game.game_won = True
+            game.game_over = True
+            game.finish_time = game.total_time + (now - game.start_time)
+    check_obstacles(game)
+
+class Simulation:
+    """Steps a GameState one tick at a time, independent of any window or timer."""
+
+    def __init__(self, game, input_source=None, profiler=None, preload=False):
+        self.game = game
+        self.tick = 0
+        # Called with the Simulation before every tick, e.g. to replay recorded input
+        self.input_source = input_source
+        self.profiler = profiler or Profiler()
+        # Build the next level on a worker thread while a banner is showing
+        self.preload = preload
+        # Called with each pre-built Level on the worker thread, e.g. to prepare geometry
+        self.level_built = None
+        self._executor = None
+        self._next_level = None
+
+    def step(self, inputs=None):
+        with self.profiler.section('tick'):
+            self._step(inputs)
+
+    def _step(self, inputs):
+        game = self.game
+        profiler = self.profiler
+        if self.input_source is not None:
+            self.input_source(self)
+        if self.preload:
+            if game.level_complete:
+                self._prepare(game.current_level + 1, game.run)
+            elif game.game_over and not game.game_won:
+                self._prepare(1, game.run + 1)
+        if game.level_complete and game.clock.now() - game.level_up_time >= game.level_up_display_duration:
+            self.advance_level()
+        if inputs:
+            for key, pressed in inputs.items():
+                if key in game.keys_pressed:
+                    game.keys_pressed[key] = pressed
+        if not game.game_over and not game.level_complete:
+            now = game.clock.now()
+            if game.world is not None:
+                with profiler.section('stream_world'):
+                    game.world.follow(game)
+            with profiler.section('update_spotter'):
+                update_spotter(game, now)
+            with profiler.section('update_player_movement'):
+                update_player_movement(game, now)
+            with profiler.section('update_bullets'):
+                update_bullets(game)
+            with profiler.section('update_npcs'):
+                update_npcs(game, now)
+        game.clock.advance(1.0 / game.TICK_RATE)
+        self.tick += 1
+
+    def run(self, ticks, inputs=None):
+        for _ in range(ticks):
+            self.step(inputs)
+            if self.game.game_over:
+                break
+        return self.tick
+
+    def _prepare(self, number, run):
+        if self._next_level is None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix='level-preload')
+            self._next_level = self._executor.submit(self._build, number, run)
+
+    def _build(self, number, run):
+        level = Level(self.game, number, run)
+        if self.level_built is not None:
+            self.level_built(level)
+        return level
+
+    def _take_level(self):
+        """The pre-built level, waiting for it if it is still being built."""
+        future, self._next_level = self._next_level, None
+        return future.result() if future is not None else None
+
+    def advance_level(self):
+        self.game.current_level += 1
+        self.game.reset_level(self._take_level())
+
+    def restart(self):
+        self.game.run += 1
+        self.game.current_level = 1
+        self.game.total_time = 0
+        self.game.reset_level(self._take_level())
@@ -0,0 +1,301 @@
+"""Quantized, delta-compressed binary snapshots of a game or room.
+
+A snapshot holds a table of slots per entity kind (players, NPCs,
+bullets) with one integer array per field: positions in 1/16 units,
+angles in 1/65536 turns, and a status byte that is 0 for an empty slot.
+It is encoded against a baseline the receiver already has:
+
+    header:  sequence, baseline sequence, tick, level, flags, head angle
+    table:   slot count, one dirty bit per slot, a dirty bit per field of
+             each dirty slot, then per field the changes of the dirty
+             slots, as int16 deltas where they all fit and int32 if not
+
+Unchanged slots cost one bit. A baseline of None encodes against an
+empty snapshot, which is how receivers without one start. Everything
+works on whole arrays; no per-entity Python objects are made either way.
+
+    python snapshot.py --players 456
+"""
+import argparse
+import json
+import struct
+import sys
+import time
+
+import numpy as np
+
+POS_SCALE = 16
+ANGLE_SCALE = 65536 / 360
+NO_BASELINE = 0xFFFFFFFF
+# Snapshots a History keeps, and so how far back a baseline can be
+HISTORY_SIZE = 64
+
+# Field kinds: quantized position, wrapping angle, raw status byte
+POS, ANGLE, FLAG = 'pos', 'angle', 'flag'
+_DTYPES = {POS: np.int32, ANGLE: np.uint16, FLAG: np.uint8}
+
+TABLES = {
+    'players': (('x', POS), ('y', POS), ('angle', ANGLE), ('status', FLAG)),
+    'npcs': (('x', POS), ('y', POS), ('angle', ANGLE), ('status', FLAG)),
+    'bullets': (('x', POS), ('y', POS), ('status', FLAG))
+}
+
+# Position fields per table, each of which always encodes its delta width
+_POS_FIELDS = {name: sum(kind == POS for _, kind in specs) for name, specs in TABLES.items()}
+
+_HEADER = struct.Struct('<IIIHBH')
+_COUNT = struct.Struct('<I')
+
+def quantize_pos(values):
+    return np.round(np.asarray(values) * POS_SCALE).astype(np.int32)
+
+def quantize_angle(values):
+    return (np.round(np.asarray(values) % 360 * ANGLE_SCALE).astype(np.int64) % 65536).astype(np.uint16)
+
+class Snapshot:
+    """Quantized state at one tick: header values and a dict of field arrays per table."""
+
+    def __init__(self, tick=0, level=1, red=False, round_over=False, head_angle=0, tables=None, sequence=0):
+        self.sequence = sequence
+        self.tick = tick
+        self.level = level
+        self.red = red
+        self.round_over = round_over
+        self.head_angle = head_angle
+        self.tables = tables or {name: _empty(name, 0) for name in TABLES}
+
+    def positions(self, table):
+        """(x, y) of the occupied slots of a table, in world units."""
+        fields = self.tables[table]
+        present = fields['status'] != 0
+        return np.column_stack((fields['x'][present], fields['y'][present])) / POS_SCALE
+
+def _empty(name, count):
+    return {field: np.zeros(count, dtype=_DTYPES[kind]) for field, kind in TABLES[name]}
+
+def _resized(fields, name, count):
+    """A table padded with empty slots, or cut, to count slots."""
+    have = len(fields['status'])
+    if have == count:
+        return fields
+    out = _empty(name, count)
+    keep = min(have, count)
+    for field in out:
+        out[field][:keep] = fields[field][:keep]
+    return out
+
+def capture(room, sequence=0):
+    """Snapshot of a multiplayer Room."""
+    game = room.game
+    players = room.players
+    npcs = game.npcs
+    bullets = room.bullets
+    return Snapshot(room.tick, game.current_level, game.spotter_state == "red", room.round_over_time is not None,
+                    quantize_angle(game.spotter_head_angle), {
+        'players': {
+            'x': quantize_pos(players.pos[:, 0]),
+            'y': quantize_pos(players.pos[:, 1]),
+            'angle': quantize_angle(players.angle),
+            'status': np.where(players.connected, players.status + 1, 0).astype(np.uint8)
+        },
+        'npcs': _npcs(npcs),
+        'bullets': _bullets(bullets)
+    }, sequence)
+
+def capture_game(sim, sequence=0):
+    """Snapshot of a single-player Simulation, the player in slot 0."""
+    game = sim.game
+    status = 2 if game.player_caught else 3 if game.game_won or game.level_complete else 1
+    return Snapshot(sim.tick, game.current_level, game.spotter_state == "red", game.level_complete or game.game_over,
+                    quantize_angle(game.spotter_head_angle), {
+        'players': {
+            'x': quantize_pos([game.player_pos[0]]),
+            'y': quantize_pos([game.player_pos[1]]),
+            'angle': quantize_angle([game.player_angle]),
+            'status': np.array([status], dtype=np.uint8)
+        },
+        'npcs': _npcs(game.npcs),
+        'bullets': _bullets(game.bullets)
+    }, sequence)
+
+def _npcs(npcs):
+    return {
+        'x': quantize_pos(npcs.pos[:, 0]),
+        'y': quantize_pos(npcs.pos[:, 1]),
+        'angle': quantize_angle(npcs.angle),
+        'status': (1 + npcs.caught + 2 * npcs.finished).astype(np.uint8)
+    }
+
+def _bullets(bullets):
+    return {
+        'x': quantize_pos(bullets.pos[:, 0]),
+        'y': quantize_pos(bullets.pos[:, 1]),
+        'status': bullets.active.astype(np.uint8)
+    }
+
+def _encode_table(name, fields, base, out):
+    count = len(fields['status'])
+    base = _resized(base, name, count)
+    specs = TABLES[name]
+    changed = np.empty((count, len(specs)), dtype=bool)
+    for i, (field, _) in enumerate(specs):
+        np.not_equal(fields[field], base[field], out=changed[:, i])
+    dirty = changed.any(axis=1)
+    changed = changed[dirty]
+    out += _COUNT.pack(count)
+    out += np.packbits(dirty).tobytes()
+    out += np.packbits(changed).tobytes()
+    for i, (field, kind) in enumerate(specs):
+        rows = np.flatnonzero(dirty)[changed[:, i]]
+        if kind == FLAG:
+            out += fields[field][rows].tobytes()
+            continue
+        if kind == ANGLE:
+            # Wrapping difference, always within int16
+            out += (fields[field][rows] - base[field][rows]).view(np.int16).astype('<i2').tobytes()
+            continue
+        delta = fields[field][rows].astype(np.int64) - base[field][rows]
+        wide = bool(delta.size) and (delta.min() < -32768 or delta.max() > 32767)
+        out.append(4 if wide else 2)
+        out += delta.astype('<i4' if wide else '<i2').tobytes()
+
+def encode(snapshot, baseline=None):
+    """Bytes that turn the baseline (or an empty snapshot) into this one."""
+    base = baseline or Snapshot()
+    flags = snapshot.red | snapshot.round_over << 1
+    out = bytearray(_HEADER.pack(snapshot.sequence, NO_BASELINE if baseline is None else baseline.sequence,
+                                 snapshot.tick, snapshot.level, flags, int(snapshot.head_angle)))
+    for name in TABLES:
+        _encode_table(name, snapshot.tables[name], base.tables[name], out)
+    return bytes(out)
+
+def baseline_of(data):
+    """The baseline sequence a message was encoded against, or None."""
+    sequence = _HEADER.unpack_from(data)[1]
+    return None if sequence == NO_BASELINE else sequence
+
+def decode(data, baseline=None):
+    """The snapshot in data, applied to the baseline it was encoded against.
+
+    Fields without changes share the baseline's arrays rather than copy
+    them, so decoded snapshots are to be read, never written to.
+    """
+    sequence, base_sequence, tick, level, flags, head_angle = _HEADER.unpack_from(data)
+    if (base_sequence == NO_BASELINE) != (baseline is None) or (
+            baseline is not None and baseline.sequence != base_sequence):
+        raise ValueError("snapshot was encoded against a different baseline")
+    base = baseline or Snapshot()
+    buffer = memoryview(data)
+    offset = _HEADER.size
+    tables = {}
+    for name, specs in TABLES.items():
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        size = (count + 7) // 8
+        fields = dict(_resized(base.tables[name], name, count))
+        tables[name] = fields
+        if not any(buffer[offset:offset + size]):
+            # No dirty slots: no changed bits, nothing per field but the position widths
+            offset += size + _POS_FIELDS[name]
+            continue
+        dirty = np.unpackbits(np.frombuffer(buffer, np.uint8, size, offset), count=count).view(bool)
+        offset += size
+        rows = np.flatnonzero(dirty)
+        size = (rows.size * len(specs) + 7) // 8
+        changed = np.unpackbits(np.frombuffer(buffer, np.uint8, size, offset),
+                                count=rows.size * len(specs)).view(bool).reshape(rows.size, len(specs))
+        offset += size
+        for i, (field, kind) in enumerate(specs):
+            where = rows[changed[:, i]]
+            if kind == POS:
+                width = data[offset]
+                offset += 1
+            if not where.size:
+                continue
+            values = fields[field] = fields[field].copy()
+            if kind == FLAG:
+                values[where] = np.frombuffer(buffer, np.uint8, where.size, offset)
+                offset += where.size
+            elif kind == ANGLE:
+                values[where] += np.frombuffer(buffer, '<i2', where.size, offset).view(np.uint16)
+                offset += 2 * where.size
+            else:
+                values[where] += np.frombuffer(buffer, '<i4' if width == 4 else '<i2', where.size, offset)
+                offset += width * where.size
+    return Snapshot(tick, level, bool(flags & 1), bool(flags & 2), head_angle, tables, sequence)
+
+class History:
+    """The last few snapshots sent, by sequence number, for encoding against what a receiver acknowledged."""
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.snapshots = {}
+        self.sequence = 0
+
+    def add(self, snapshot):
+        self.sequence += 1
+        snapshot.sequence = self.sequence
+        self.snapshots[self.sequence] = snapshot
+        self.snapshots.pop(self.sequence - self.size, None)
+        return snapshot
+
+    def get(self, sequence):
+        return self.snapshots.get(sequence)
+
+def bench(players, ticks, ack_delay, seed=0):
+    """Encode and decode a room of bots every tick; returns sizes and times per tick."""
+    from room import Room
+    room = Room(seed, max_players=players)
+    for _ in range(players):
+        slot = room.join()
+        room.players.angle[slot] = 90
+    rng = np.random.default_rng(seed)
+    history = History()
+    received = {}
+    sizes, full_sizes, encode_times, decode_times = [], [], [], []
+    for tick in range(ticks):
+        # Runners that mostly go on green and now and then turn
+        red = room.game.spotter_state == "red"
+        go = ~red | (rng.random(room.players.capacity) < 0.02)
+        room.players.keys[:, 0] = go
+        room.players.keys[:, 2] = rng.random(room.players.capacity) < 0.05
+        room.step()
+        start = time.perf_counter()
+        current = history.add(capture(room))
+        baseline = history.get(current.sequence - ack_delay)
+        data = encode(current, baseline)
+        encode_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        decoded = decode(data, received.get(baseline_of(data)))
+        decode_times.append(time.perf_counter() - start)
+        received[decoded.sequence] = decoded
+        received.pop(decoded.sequence - history.size, None)
+        sizes.append(len(data))
+        if tick % 10 == 0:
+            full_sizes.append(len(encode(current)))
+    for name, fields in current.tables.items():
+        for field, values in fields.items():
+            assert np.array_equal(decoded.tables[name][field], values), (name, field)
+    return {
+        'players': players,
+        'ticks': ticks,
+        'ack_delay': ack_delay,
+        'delta_bytes_per_tick': float(np.mean(sizes)),
+        'full_bytes_per_tick': float(np.mean(full_sizes)),
+        'delta_kbit_per_second_per_client': float(np.mean(sizes)) * 8 * room.game.TICK_RATE / 1000,
+        'encode_ms': {'median': float(np.median(encode_times) * 1000), 'p99': float(np.percentile(encode_times, 99) * 1000)},
+        'decode_ms': {'median': float(np.median(decode_times) * 1000), 'p99': float(np.percentile(decode_times, 99) * 1000)}
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark snapshot size and encode time for a room of bots.")
+    parser.add_argument('--players', type=int, default=456)
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--ack-delay', type=int, nargs='+', default=[1, 6],
+                        help="ticks between a snapshot and the baseline it is encoded against")
+    args = parser.parse_args(argv)
+    json.dump([bench(args.players, args.ticks, delay) for delay in args.ack_delay], sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Uniform grid index over static 2D points for exact radius queries."""
+import math
+
+import numpy as np
+
+class SpatialGrid:
+    """Buckets points into square cells stored as sorted runs (CSR layout).
+
+    A radius query only visits the cells the query circle can reach, and
+    still does the exact distance test, so results match a brute-force scan.
+    """
+
+    def __init__(self, points, cell_size):
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+        if len(self.points) == 0:
+            self.origin = np.zeros(2)
+            self.shape = (0, 0)
+            self.order = np.zeros(0, dtype=int)
+            self.start = np.zeros(0, dtype=int)
+            self.count = np.zeros(0, dtype=int)
+            self.max_count = 0
+            return
+        self.origin = self.points.min(axis=0)
+        cells = np.floor((self.points - self.origin) / self.cell_size).astype(int)
+        nx, ny = cells.max(axis=0) + 1
+        self.shape = (int(nx), int(ny))
+        keys = cells[:, 0] * ny + cells[:, 1]
+        self.order = np.argsort(keys, kind='stable')
+        self.count = np.bincount(keys, minlength=nx * ny)
+        self.start = np.concatenate(([0], np.cumsum(self.count)[:-1]))
+        self.max_count = int(self.count.max())
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cell(self, x, y):
+        return (math.floor((x - self.origin[0]) / self.cell_size),
+                math.floor((y - self.origin[1]) / self.cell_size))
+
+    def query(self, x, y, radius):
+        """Indices of points strictly closer than radius to (x, y), in insertion order."""
+        if not len(self.points):
+            return []
+        nx, ny = self.shape
+        reach = math.ceil(radius / self.cell_size)
+        cx, cy = self._cell(x, y)
+        r2 = radius * radius
+        found = []
+        for gx in range(max(cx - reach, 0), min(cx + reach + 1, nx)):
+            for gy in range(max(cy - reach, 0), min(cy + reach + 1, ny)):
+                key = gx * ny + gy
+                start = self.start[key]
+                for j in self.order[start:start + self.count[key]]:
+                    dx = x - self.points[j, 0]
+                    dy = y - self.points[j, 1]
+                    if dx*dx + dy*dy < r2:
+                        found.append(int(j))
+        found.sort()
+        return found
+
+    def any_within(self, xs, ys, radius):
+        """Batched query: for each (x, y) pair, whether any point is closer than radius."""
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        hit = np.zeros(xs.shape, dtype=bool)
+        if not len(self.points) or not xs.size:
+            return hit
+        nx, ny = self.shape
+        reach = math.ceil(radius / self.cell_size)
+        cx = np.floor((xs - self.origin[0]) / self.cell_size).astype(int)
+        cy = np.floor((ys - self.origin[1]) / self.cell_size).astype(int)
+        r2 = radius * radius
+        for ox in range(-reach, reach + 1):
+            gx = cx + ox
+            for oy in range(-reach, reach + 1):
+                gy = cy + oy
+                inside = (gx >= 0) & (gx < nx) & (gy >= 0) & (gy < ny)
+                if not inside.any():
+                    continue
+                key = np.where(inside, gx * ny + gy, 0)
+                start = self.start[key]
+                count = np.where(inside, self.count[key], 0)
+                for k in range(self.max_count):
+                    valid = k < count
+                    if not valid.any():
+                        break
+                    j = self.order[np.where(valid, start + k, 0)]
+                    dx = xs - self.points[j, 0]
+                    dy = ys - self.points[j, 1]
+                    hit |= valid & (dx*dx + dy*dy < r2)
+        return hit
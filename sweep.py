@@ -0,0 +1,238 @@
+"""Headless difficulty sweeps: many bot games across a process pool.
+
+Each combination of difficulty settings is played by scripted bots over a
+range of seeds. Every finished game is appended to a JSON-lines file as
+soon as it comes back from a worker, so an interrupted sweep picks up
+where it left off when started again with the same output file:
+
+    python sweep.py --length-growth 0.1 0.15 0.2 --bullet-growth 0.05 0.1 --games 500
+    python sweep.py --summarize sweep.jsonl
+
+The summary gives per-level win rates, what caught the player and
+completion times for every setting and bot.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from multiprocessing import Pool
+
+from simulation import GameState, Simulation
+
+# Settings a sweep can vary, as GameState constants
+SETTINGS = {
+    'length_growth': 'LENGTH_GROWTH',
+    'obstacles_per_level': 'OBSTACLES_PER_LEVEL',
+    'bullet_growth': 'BULLET_SPEED_GROWTH',
+    'spotter_growth': 'SPOTTER_TURN_GROWTH',
+    'player_speed_growth': 'PLAYER_SPEED_GROWTH'
+}
+
+# reaction: ticks between the light changing and the bot noticing, or None
+# to ignore the light altogether; avoid: whether it steers around obstacles
+BOTS = {
+    'runner': {'reaction': None, 'avoid': True},
+    'cautious': {'reaction': (4, 15), 'avoid': True},
+    'careless': {'reaction': (10, 30), 'avoid': False}
+}
+
+class Bot:
+    """Drives the player toward the finish line through Simulation.input_source."""
+
+    def __init__(self, reaction, avoid, seed):
+        self.rng = random.Random(seed)
+        self.reaction = reaction
+        self.avoid = avoid
+        self.seen_state = "green"
+        self.pending = None
+
+    def _light(self, game):
+        """The light as the bot perceives it, lagging behind the real one."""
+        if game.spotter_state != self.seen_state:
+            if self.pending is None:
+                self.pending = self.rng.randint(*self.reaction)
+            self.pending -= 1
+            if self.pending <= 0:
+                self.seen_state = game.spotter_state
+                self.pending = None
+        return self.seen_state
+
+    def _target_y(self, game):
+        y = game.player_pos[1]
+        if self.avoid:
+            x = game.player_pos[0]
+            for ox, oy in game.obstacles:
+                if 0 < ox - x < 100 and abs(oy - y) < game.OBSTACLE_RADIUS + 20:
+                    return oy - 70 if y < oy else oy + 70
+        return y
+
+    def __call__(self, sim):
+        game = sim.game
+        keys = game.keys_pressed
+        x, y = game.player_pos[0], game.player_pos[1]
+        # Moving forward heads along (sin a, -cos a) for player angle a
+        ux, uy = 100, self._target_y(game) - y
+        wanted = math.degrees(math.atan2(ux, -uy))
+        turn = (wanted - game.player_angle + 180) % 360 - 180
+        keys[b'a'] = turn > game.TURN_SPEED / 2
+        keys[b'd'] = turn < -game.TURN_SPEED / 2
+        go = abs(turn) < 30
+        if self.reaction is not None:
+            go = go and self._light(game) == "green"
+        keys[b'w'] = go
+
+def play(task):
+    """Play one game to the end and report how each level went."""
+    settings, bot_name, seed, max_ticks, freeze = task
+    game = GameState(seed=seed)
+    for name, value in settings.items():
+        setattr(game, SETTINGS[name], value)
+    game.FREEZE_ON_RED = freeze
+    game.reset_level()
+    bot = BOTS[bot_name]
+    sim = Simulation(game, Bot(bot['reaction'], bot['avoid'], seed))
+    levels = []
+    while sim.tick < max_ticks:
+        sim.step()
+        level = game.current_level
+        if game.level_complete and len(levels) < level:
+            levels.append({'level': level, 'outcome': 'complete', 'time': game.level_up_time - game.start_time})
+        elif game.game_over:
+            if game.game_won:
+                levels.append({'level': level, 'outcome': 'complete',
+                               'time': game.finish_time - game.total_time})
+            else:
+                levels.append({'level': level, 'outcome': 'caught', 'cause': game.caught_by,
+                               'time': game.clock.now() - game.start_time})
+            break
+    else:
+        levels.append({'level': game.current_level, 'outcome': 'timeout',
+                       'time': game.clock.now() - game.start_time})
+    return {
+        'settings': settings,
+        'bot': bot_name,
+        'seed': seed,
+        'won': game.game_won,
+        'ticks': sim.tick,
+        'levels': levels
+    }
+
+def task_key(settings, bot, seed):
+    return json.dumps([sorted(settings.items()), bot, seed])
+
+def completed(path):
+    """Keys of the games already in a results file; a torn last line is ignored."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            done.add(task_key(result['settings'], result['bot'], result['seed']))
+    return done
+
+def tasks(args):
+    names = [name for name in SETTINGS if getattr(args, name) is not None]
+    for values in itertools.product(*(getattr(args, name) for name in names)):
+        settings = dict(zip(names, values))
+        for bot in args.bots:
+            for seed in range(args.first_seed, args.first_seed + args.games):
+                yield settings, bot, seed
+
+def run(args):
+    done = completed(args.output)
+    todo = [(s, b, seed, args.max_ticks, args.freeze) for s, b, seed in tasks(args)
+            if task_key(s, b, seed) not in done]
+    print(f"{len(done)} games already done, {len(todo)} to play", file=sys.stderr)
+    if not todo:
+        return
+    # Trim a partial line left by an interrupted run before appending
+    if os.path.exists(args.output):
+        with open(args.output, 'rb+') as f:
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+    start = time.perf_counter()
+    # Small chunks keep results streaming in; games are long enough to hide the overhead
+    chunksize = max(1, min(8, len(todo) // (args.workers * 16)))
+    with open(args.output, 'a') as out, Pool(args.workers) as pool:
+        for i, result in enumerate(pool.imap_unordered(play, todo, chunksize), 1):
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            if i % 100 == 0 or i == len(todo):
+                rate = i / (time.perf_counter() - start)
+                print(f"{i}/{len(todo)} games, {rate:.1f} games/s", file=sys.stderr)
+
+def summarize(path):
+    """Aggregate a results file into per-setting, per-bot, per-level statistics."""
+    groups = {}
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            key = (json.dumps(result['settings'], sort_keys=True), result['bot'])
+            group = groups.setdefault(key, {'games': 0, 'wins': 0, 'levels': {}})
+            group['games'] += 1
+            group['wins'] += result['won']
+            for entry in result['levels']:
+                level = group['levels'].setdefault(entry['level'], {'attempts': 0, 'complete': 0, 'causes': {}, 'times': []})
+                level['attempts'] += 1
+                if entry['outcome'] == 'complete':
+                    level['complete'] += 1
+                    level['times'].append(entry['time'])
+                else:
+                    cause = entry.get('cause') or entry['outcome']
+                    level['causes'][cause] = level['causes'].get(cause, 0) + 1
+    summary = []
+    for (settings, bot), group in sorted(groups.items()):
+        levels = []
+        for number, level in sorted(group['levels'].items()):
+            times = level.pop('times')
+            levels.append({
+                'level': number,
+                **level,
+                'win_rate': level['complete'] / level['attempts'],
+                'median_time': statistics.median(times) if times else None,
+                'mean_time': statistics.fmean(times) if times else None
+            })
+        summary.append({
+            'settings': json.loads(settings),
+            'bot': bot,
+            'games': group['games'],
+            'win_rate': group['wins'] / group['games'],
+            'levels': levels
+        })
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--length-growth', type=float, nargs='+')
+    parser.add_argument('--obstacles-per-level', type=int, nargs='+')
+    parser.add_argument('--bullet-growth', type=float, nargs='+')
+    parser.add_argument('--spotter-growth', type=float, nargs='+')
+    parser.add_argument('--player-speed-growth', type=float, nargs='+')
+    parser.add_argument('--bots', nargs='+', choices=sorted(BOTS), default=['cautious'])
+    parser.add_argument('--games', type=int, default=100, help="seeds per setting and bot")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=60 * 60 * 5)
+    parser.add_argument('--mugunghwa', dest='freeze', action='store_false',
+                        help="only catch actual movement on red, as Mugunghwa does")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-o', '--output', default='sweep.jsonl')
+    parser.add_argument('--summarize', metavar='RESULTS', help="only summarize an existing results file")
+    args = parser.parse_args(argv)
+    if not args.summarize:
+        run(args)
+    print(json.dumps(summarize(args.summarize or args.output), indent=2))
+
+if __name__ == "__main__":
+    main()
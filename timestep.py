@@ -0,0 +1,119 @@
+"""Fixed-timestep driver with interpolated render state.
+
+The simulation always advances in ticks of 1 / TICK_RATE seconds, no
+matter how often the display refreshes. Rendering gets a view that
+blends the previous and current tick by how far the accumulator has
+progressed into the next one.
+"""
+import time
+
+import numpy as np
+
+def _lerp_angle(a, b, alpha):
+    return a + ((b - a + 180) % 360 - 180) * alpha
+
+class Snapshot:
+    """Copies of the moving parts of a GameState, taken before a tick."""
+
+    def __init__(self, game):
+        self.world_version = game.world_version
+        self.player_pos = list(game.player_pos)
+        self.player_angle = game.player_angle
+        self.spotter_head_angle = game.spotter_head_angle
+        self.npc_pos = game.npcs.pos.copy()
+        self.npc_angle = game.npcs.angle.copy()
+        self.bullet_pos = game.bullets.pos.copy()
+        self.bullet_active = game.bullets.active.copy()
+
+class CrowdView:
+    def __init__(self, crowd, pos, angle):
+        self._crowd = crowd
+        self.pos = pos
+        self.angle = angle
+
+    def __getattr__(self, name):
+        return getattr(self._crowd, name)
+
+    def __len__(self):
+        return len(self._crowd)
+
+class BulletView:
+    def __init__(self, positions):
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    def positions(self):
+        return self._positions
+
+class RenderView:
+    """Read-only stand-in for a GameState with interpolated positions and angles."""
+
+    def __init__(self, game, previous, alpha):
+        self._game = game
+        if previous is None or previous.world_version != game.world_version:
+            alpha = 1.0
+            previous = Snapshot(game)
+        a = alpha
+        self.player_pos = [p + (c - p) * a for p, c in zip(previous.player_pos, game.player_pos)]
+        self.player_angle = _lerp_angle(previous.player_angle, game.player_angle, a)
+        self.spotter_head_angle = previous.spotter_head_angle + (game.spotter_head_angle - previous.spotter_head_angle) * a
+        npcs = game.npcs
+        self.npcs = CrowdView(
+            npcs,
+            previous.npc_pos + (npcs.pos - previous.npc_pos) * a,
+            _lerp_angle(previous.npc_angle, npcs.angle, a)
+        )
+        bullets = game.bullets
+        capacity = min(len(previous.bullet_active), bullets.capacity)
+        pos = bullets.pos.copy()
+        both = np.zeros(bullets.capacity, dtype=bool)
+        both[:capacity] = previous.bullet_active[:capacity] & bullets.active[:capacity]
+        pos[both] = previous.bullet_pos[both] + (bullets.pos[both] - previous.bullet_pos[both]) * a
+        self.bullets = BulletView(pos[bullets.active])
+
+    def __getattr__(self, name):
+        return getattr(self._game, name)
+
+class FixedStepLoop:
+    """Accumulates real frame time and spends it in fixed simulation ticks."""
+
+    def __init__(self, sim, clock=time.perf_counter):
+        self.sim = sim
+        self.clock = clock
+        self.accumulator = 0.0
+        self.last_time = None
+        self.previous = None
+
+    @property
+    def dt(self):
+        return 1.0 / self.sim.game.TICK_RATE
+
+    @property
+    def alpha(self):
+        return min(self.accumulator / self.dt, 1.0)
+
+    def advance(self, inputs=None):
+        """Run as many whole ticks as real time allows; returns the number run."""
+        game = self.sim.game
+        dt = self.dt
+        max_ticks = game.MAX_CATCH_UP_TICKS
+        now = self.clock()
+        if self.last_time is None:
+            self.last_time = now
+        self.accumulator += min(now - self.last_time, dt * max_ticks)
+        self.last_time = now
+        ticks = 0
+        while self.accumulator >= dt and ticks < max_ticks:
+            self.previous = Snapshot(game)
+            self.sim.step(inputs)
+            self.accumulator -= dt
+            ticks += 1
+        if ticks == max_ticks:
+            # Too far behind: drop the backlog instead of spiralling
+            self.accumulator = min(self.accumulator, dt)
+        return ticks
+
+    def view(self):
+        return RenderView(self.sim.game, self.previous, self.alpha)
@@ -0,0 +1,64 @@
+"""The spotter's view cone, tested for every moving actor at once.
+
+An actor is seen when the angle between the spotter's facing and the
+direction to the actor is below a threshold. Rather than an atan2 and a
+modulo per actor, the test compares the dot product of the facing with
+the offset to the actor against cos(threshold) times its length. Actors
+inside the cone are then checked for a clear line of sight.
+"""
+import math
+
+import numpy as np
+
+from bullets import SPOTTER
+
+NPC_DETECTION_ANGLE = 30
+
+def player_detection_angle(game):
+    # A faster-turning spotter sweeps, and so watches, a wider cone
+    return 30 + abs(game.SPOTTER_TURN_SPEED) * 5
+
+def cone_cosine(angle):
+    """Threshold for the dot product test; anything wider than 180 degrees sees everything."""
+    return math.cos(math.radians(angle)) if angle <= 180 else -math.inf
+
+def facing(game):
+    # Head angle 0 looks down -y, matching atan2(dy, dx) + 90 in degrees
+    head = math.radians(game.spotter_head_angle)
+    return math.sin(head), -math.cos(head)
+
+def in_view(game, xs, ys, cosines):
+    """Mask of the points inside the spotter's view cone, one cosine threshold per point."""
+    fx, fy = facing(game)
+    dx = xs - game.spotter_pos[0]
+    dy = ys - game.spotter_pos[1]
+    # atan2(0, 0) is 0, so a point on the spotter counts as lying along +x
+    here = (dx == 0) & (dy == 0)
+    dx = np.where(here, 1.0, dx)
+    return dx * fx + dy * fy > cosines * np.hypot(dx, dy)
+
+def seen(game, xs, ys, cosines):
+    """Mask of the points inside the view cone with a clear line to the spotter."""
+    seen = in_view(game, xs, ys, cosines)
+    if game.LINE_OF_SIGHT:
+        # Obstacles and trees hide whoever stands behind them
+        seen[seen] = game.sight.visible(xs[seen], ys[seen])
+    return seen
+
+def player_trying_to_move(game):
+    return game.keys_pressed[b'w'] or game.keys_pressed[b's']
+
+def detect_npcs(game, now):
+    """Catch every NPC that moved inside the view cone during a red light."""
+    npcs = game.npcs
+    movers = np.flatnonzero(npcs.active & (now - npcs.last_move_time < 0.1))
+    if movers.size:
+        caught = seen(game, npcs.pos[movers, 0], npcs.pos[movers, 1], cone_cosine(NPC_DETECTION_ANGLE))
+        npcs.caught[movers[caught]] = True
+
+def detect_player(game):
+    """Shoot at the moving player if seen, unless a bullet already left the spotter this tick."""
+    x, y = game.player_pos[0], game.player_pos[1]
+    if seen(game, np.array([x]), np.array([y]), cone_cosine(player_detection_angle(game)))[0]:
+        if not game.bullets.has_fresh_at(game.spotter_pos[0], game.spotter_pos[1]):
+            game.bullets.spawn(game.spotter_pos[0], game.spotter_pos[1], 0, SPOTTER)
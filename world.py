@@ -0,0 +1,152 @@
+"""Marathon levels streamed in chunks along the x-axis.
+
+A level longer than GameState.STREAM_LENGTH is never generated whole.
+Its length is cut into chunks of CHUNK_LENGTH units, each generated from
+its own seed when the player comes within CHUNKS_AHEAD chunks of it and
+dropped once the player is more than CHUNKS_BEHIND chunks past it, so
+only a handful are ever resident however long the level is. The chunk
+after the window is built on a worker thread while the player crosses
+the current one, so crossing into it is only a swap. The game's
+obstacles, trees, obstacle grid and sight lines only cover the resident
+chunks; NPCs that run out of range simply meet no obstacles there.
+"""
+import math
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from occlusion import OBSTACLE_HALF_SIZE, TREE_RADIUS, OcclusionGrid, SightMap
+from spatial import SpatialGrid
+
+_executor = None
+
+def _prefetch(function, *args):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(1, thread_name_prefix='chunk-prefetch')
+    return _executor.submit(function, *args)
+
+class Chunk:
+    """Obstacles and trees of one stretch of a streamed level, with the sight lines across it."""
+
+    def __init__(self, index, obstacles, trees):
+        self.index = index
+        self.obstacles = np.asarray(obstacles, dtype=float).reshape(-1, 2)
+        self.trees = np.asarray(trees, dtype=float).reshape(-1, 2)
+        self.sight = None
+
+class StreamedSight:
+    """Line of sight past the blockers of several chunks: clear only if clear through each."""
+
+    def __init__(self, maps):
+        self.maps = maps
+
+    def visible(self, xs, ys):
+        visible = np.ones(np.shape(xs), dtype=bool)
+        for sight in self.maps:
+            visible &= sight.visible(xs, ys)
+        return visible
+
+class StreamedWorld:
+    """Generates, caches and evicts the chunks of one level."""
+
+    def __init__(self, level, source=None):
+        self.level_seed = level.level_seed
+        self.length = level.GAME_LENGTH
+        self.chunk_length = level.CHUNK_LENGTH
+        self.ahead = level.CHUNKS_AHEAD
+        self.behind = level.CHUNKS_BEHIND
+        self.obstacle_count = level.OBSTACLE_COUNT
+        self.obstacle_radius = level.OBSTACLE_RADIUS
+        self.spotter_pos = level.spotter_pos
+        # Trees reach 300 units past the spotter, who stands 200 past the finish
+        self.first = math.floor(-500 / self.chunk_length)
+        self.last = math.floor((self.length + 500) / self.chunk_length)
+        # Called with a chunk index for its contents; levels.py reads them from a file
+        self.source = source or self.generate
+        self.chunks = {}
+        self.pending = {}
+
+    def __len__(self):
+        return self.last - self.first + 1
+
+    def generate(self, index):
+        """A chunk's obstacles and trees, as dense as a whole ordinary level."""
+        seed = np.random.SeedSequence([self.level_seed, index - self.first]).generate_state(1)[0]
+        rng = random.Random(int(seed))
+        start, end = index * self.chunk_length, (index + 1) * self.chunk_length
+        low, high = max(start, 100), min(end, self.length - 100)
+        obstacles = []
+        trees = []
+        if low < high:
+            for _ in range(self.obstacle_count):
+                obstacles.append([rng.randint(low, high - 1), rng.randint(-400, 400)])
+            for _ in range(15):
+                trees.append([rng.randint(low, high - 1), rng.randint(-400, 400)])
+        for x in range(max(-400, start + -start % 100), min(end, self.length + 400), 100):
+            if rng.random() > 0.3:
+                trees.append([x, -450 + rng.randint(-20, 20)])
+            if rng.random() > 0.3:
+                trees.append([x, 450 + rng.randint(-20, 20)])
+        if start <= self.spotter_pos[0] < end:
+            for _ in range(30):
+                trees.append([self.spotter_pos[0] + rng.randint(50, 300), rng.randint(-500, 500)])
+        return obstacles, trees
+
+    def window(self, x):
+        """First and last index of the chunks to keep resident with the player at x."""
+        index = math.floor(x / self.chunk_length)
+        return max(self.first, index - self.behind), min(self.last, index + self.ahead)
+
+    def build(self, index):
+        chunk = Chunk(index, *self.source(index))
+        chunk.sight = self._sight(chunk)
+        return chunk
+
+    def _chunk(self, index):
+        chunk = self.chunks.get(index)
+        if chunk is None:
+            future = self.pending.pop(index, None)
+            chunk = future.result() if future is not None else self.build(index)
+        return chunk
+
+    def _sight(self, chunk):
+        """Sight lines from the spotter past this chunk's blockers only."""
+        start = chunk.index * self.chunk_length
+        end = start + self.chunk_length
+        blockers = np.concatenate((chunk.obstacles, chunk.trees, [[start, -550], [end, 550]]))
+        grid = OcclusionGrid((blockers.min(axis=0) - 50, blockers.max(axis=0) + 50))
+        grid.add_boxes(chunk.obstacles, OBSTACLE_HALF_SIZE)
+        grid.add_circles(chunk.trees, TREE_RADIUS)
+        field = ((max(start, -500), -500), (min(end, self.length), 500))
+        # Enough bins that neighbouring rays stay about a cell apart across the chunk
+        x, y = self.spotter_pos[0], self.spotter_pos[1]
+        far = max(math.hypot(cx - x, cy - y) for cx in (start, end) for cy in (-500, 500))
+        bins = max(2048, math.ceil(2 * math.pi * far / grid.cell_size))
+        return SightMap(grid, x, y, bins, field)
+
+    def resident(self, window):
+        """The chunks of a window, generating what is missing and evicting the rest."""
+        first, last = window
+        self.chunks = {index: self._chunk(index) for index in range(first, last + 1)}
+        if last < self.last and last + 1 not in self.pending:
+            self.pending = {last + 1: _prefetch(self.build, last + 1)}
+        return tuple(self.chunks.values())
+
+    def assemble(self, window):
+        """Chunks, obstacles, trees, obstacle grid and sight lines for the game to use."""
+        chunks = self.resident(window)
+        obstacles = np.concatenate([chunk.obstacles for chunk in chunks])
+        trees = np.concatenate([chunk.trees for chunk in chunks])
+        sight = StreamedSight(tuple(chunk.sight for chunk in chunks))
+        return chunks, obstacles, trees, SpatialGrid(obstacles, self.obstacle_radius), sight
+
+    def follow(self, game):
+        """Swap in the chunks around the player once they move into another one."""
+        window = self.window(game.player_pos[0])
+        if window == game.chunk_window:
+            return False
+        game.chunk_window = window
+        game.chunks, game.obstacles, game.trees, game.obstacle_grid, game.sight = self.assemble(window)
+        return True